@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, text
+from app.database import DATABASE_URL
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction
+engine = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+
+# Category-filtered counterparts of the feed indexes in add_feed_indexes_migration.py.
+# Ascending columns serve the feed's DESC order with a backward scan.
+CATEGORY_FEED_INDEXES = {
+    "idx_polls_feed_category_created": "created_at",
+    "idx_polls_feed_category_votes": "total_votes",
+    "idx_polls_feed_category_likes": "total_likes",
+    "idx_polls_feed_category_comments": "total_comments",
+}
+
+# Single-column indexes the composite ones make redundant. Left in place they
+# also lure the planner into index scans followed by a sort.
+REDUNDANT_INDEXES = ["idx_polls_active", "idx_polls_created", "idx_polls_category"]
+
+def add_category_feed_indexes():
+    """Add (category, sort key, id) indexes for category-filtered feeds and drop the old single-column ones"""
+    with engine.connect() as conn:
+        try:
+            for name, column in CATEGORY_FEED_INDEXES.items():
+                conn.execute(text(f"""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+                    ON polls (category, {column}, id) WHERE is_active = true
+                """))
+            
+            for name in REDUNDANT_INDEXES:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            
+            print("✅ Successfully added category feed indexes!")
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    add_category_feed_indexes()
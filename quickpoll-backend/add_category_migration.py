@@ -19,10 +19,8 @@ def add_category_column():
                 ADD COLUMN IF NOT EXISTS total_comments INTEGER DEFAULT 0
             """))
             
-            # Create index on category
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_polls_category ON polls(category)
-            """))
+            # Category filters are served by the idx_polls_feed_category_* indexes
+            # (add_category_feed_indexes_migration.py)
             
             # Update total_comments for existing polls
             conn.execute(text("""
@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, text
+from app.database import DATABASE_URL
+
+# CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+engine = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+
+def replace_comment_indexes():
+    """Replace the single-column comment indexes with one (poll_id, created_at, id) index"""
+    with engine.connect() as conn:
+        try:
+            # Build the new index first so comment pages are never unindexed
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comments_poll_created
+                ON comments (poll_id, created_at, id)
+            """))
+            
+            # Its poll_id prefix covers every lookup the old indexes served
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_comments_poll"))
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_comments_created"))
+            
+            print("✅ Successfully replaced comment indexes!")
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    replace_comment_indexes()
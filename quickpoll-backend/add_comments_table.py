@@ -20,13 +20,9 @@ with engine.connect() as conn:
             );
         """))
         
-        # Create indexes
+        # Create index (newest-first pages of one poll's comments)
         conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS idx_comments_poll ON comments(poll_id);
-        """))
-        
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS idx_comments_created ON comments(created_at);
+            CREATE INDEX IF NOT EXISTS idx_comments_poll_created ON comments(poll_id, created_at, id);
         """))
         
         conn.commit()
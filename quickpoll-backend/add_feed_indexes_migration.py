@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, text
+from app.database import DATABASE_URL
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction
+engine = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+
+FEED_INDEXES = {
+    "idx_polls_feed_created": "created_at",
+    "idx_polls_feed_votes": "total_votes",
+    "idx_polls_feed_likes": "total_likes",
+    "idx_polls_feed_comments": "total_comments",
+}
+
+def add_feed_indexes():
+    """Add the (sort key, id) indexes used by keyset pagination of the poll feed"""
+    with engine.connect() as conn:
+        try:
+            # Keyset comparisons skip NULL sort keys
+            for column in ("total_votes", "total_likes", "total_comments"):
+                conn.execute(text(f"UPDATE polls SET {column} = 0 WHERE {column} IS NULL"))
+            
+            # Built concurrently so the feed keeps serving while they build
+            for name, column in FEED_INDEXES.items():
+                conn.execute(text(f"""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+                    ON polls ({column}, id) WHERE is_active = true
+                """))
+            
+            print("✅ Successfully added feed pagination indexes!")
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    add_feed_indexes()
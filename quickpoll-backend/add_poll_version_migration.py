@@ -0,0 +1,24 @@
+from sqlalchemy import create_engine, text
+from app.database import DATABASE_URL
+
+engine = create_engine(DATABASE_URL)
+
+def add_poll_version():
+    """Add the polls.version counter behind poll ETags"""
+    with engine.connect() as conn:
+        try:
+            # A constant default is stored in the catalog, so no table rewrite
+            conn.execute(text("""
+                ALTER TABLE polls
+                ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1
+            """))
+            
+            conn.commit()
+            print("✅ Successfully added polls.version!")
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    add_poll_version()
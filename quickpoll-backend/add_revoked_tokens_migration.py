@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine, text
+from app.database import DATABASE_URL
+
+engine = create_engine(DATABASE_URL)
+
+def add_revoked_tokens():
+    """Add the revoked_tokens table shared by every worker's token denylist"""
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS revoked_tokens (
+                    jti VARCHAR(64) PRIMARY KEY,
+                    expires_at TIMESTAMP NOT NULL
+                )
+            """))
+            # Expired rows are deleted by expiry on every denylist reload
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires
+                ON revoked_tokens (expires_at)
+            """))
+            
+            conn.commit()
+            print("✅ Successfully added revoked_tokens table!")
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            conn.rollback()
+
+if __name__ == "__main__":
+    add_revoked_tokens()
@@ -0,0 +1,63 @@
+from sqlalchemy import create_engine, text
+from app.database import DATABASE_URL
+
+# Autocommit: each backfill batch commits on its own and CREATE INDEX
+# CONCURRENTLY cannot run inside a transaction
+engine = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+
+BACKFILL_BATCH = 5000
+
+def add_search_vector():
+    """Add the full-text search column, its trigger and GIN index to polls"""
+    with engine.connect() as conn:
+        try:
+            # Nullable column without a default: metadata-only, no table rewrite
+            conn.execute(text("""
+                ALTER TABLE polls ADD COLUMN IF NOT EXISTS search_vector tsvector
+            """))
+            
+            # Keep the vector in sync on every insert and title/description edit
+            conn.execute(text("""
+                CREATE OR REPLACE FUNCTION polls_search_vector_update() RETURNS trigger AS $$
+                BEGIN
+                    NEW.search_vector :=
+                        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            """))
+            conn.execute(text("DROP TRIGGER IF EXISTS polls_search_vector_trigger ON polls"))
+            conn.execute(text("""
+                CREATE TRIGGER polls_search_vector_trigger
+                BEFORE INSERT OR UPDATE OF title, description ON polls
+                FOR EACH ROW EXECUTE FUNCTION polls_search_vector_update()
+            """))
+            
+            # Backfill existing rows in small batches to keep row locks short
+            total = 0
+            while True:
+                result = conn.execute(text("""
+                    UPDATE polls SET title = title
+                    WHERE id IN (
+                        SELECT id FROM polls WHERE search_vector IS NULL
+                        LIMIT :batch
+                    )
+                """), {"batch": BACKFILL_BATCH})
+                if result.rowcount == 0:
+                    break
+                total += result.rowcount
+            print(f"Backfilled {total} polls")
+            
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_polls_search
+                ON polls USING gin (search_vector)
+            """))
+            
+            print("✅ Successfully added poll search index!")
+            
+        except Exception as e:
+            print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    add_search_vector()
@@ -1,42 +1,177 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from typing import Optional
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional
 from uuid import UUID
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
 import secrets
-from datetime import datetime, timedelta
-from .database import get_db
-from .models import User
+import time
+from .cache import TTLCache
+from .database import AsyncSessionLocal, get_db
+from .models import RevokedToken, User
+from .pubsub import Broker
 
 security = HTTPBearer(auto_error=False)
 
-# Simple in-memory token storage (in production, use Redis or database)
-active_tokens = {}
+# Tokens are signed with SECRET_KEY, so every worker sharing the key can
+# verify them without any shared token store
+SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY:
+    print("⚠️  SECRET_KEY not set - using a random key, tokens will not survive restarts or work across workers")
+    SECRET_KEY = secrets.token_urlsafe(32)
+
+ACCESS_TOKEN_TTL = timedelta(days=7)
+
+# Users looked up by authenticated requests, keyed by id
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# Revoked token ids -> expiry (epoch seconds). The revoked_tokens table is the
+# source of truth; every worker keeps a full copy, loaded at startup, updated
+# through pub/sub and reloaded every REVOKED_TOKENS_SYNC_SECONDS in case a
+# message was missed. Entries are never evicted early, only once the token
+# has expired, so memory grows with the revocations of one token lifetime.
+REVOKED_TOKENS_SYNC_SECONDS = int(os.getenv("REVOKED_TOKENS_SYNC_SECONDS", "60"))
+revoked_tokens: Dict[str, float] = {}
+REVOKE_CHANNEL = "auth_revoke"
+_broker: Optional[Broker] = None
+_sync_task: Optional[asyncio.Task] = None
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SECRET_KEY.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
 
 def create_access_token(user_id: UUID) -> str:
-    """Create a simple access token"""
-    token = secrets.token_urlsafe(32)
-    active_tokens[token] = {
-        "user_id": str(user_id),
-        "expires": datetime.utcnow() + timedelta(days=7)
-    }
-    return token
+    """Create a signed access token: base64(payload).base64(hmac)"""
+    now = int(time.time())
+    payload = _b64encode(json.dumps({
+        "sub": str(user_id),
+        "iat": now,
+        "exp": now + int(ACCESS_TOKEN_TTL.total_seconds()),
+        "jti": secrets.token_urlsafe(12),
+    }, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify token and return user_id"""
-    if token not in active_tokens:
+def decode_token(token: str) -> Optional[dict]:
+    """Return the claims of a correctly signed, unexpired, unrevoked token"""
+    # Tokens are base64url; anything else cannot be signed or compared
+    if not token.isascii():
         return None
-    
-    token_data = active_tokens[token]
-    if datetime.utcnow() > token_data["expires"]:
-        del active_tokens[token]
+    payload, _, signature = token.partition(".")
+    if not payload or not hmac.compare_digest(signature, _sign(payload)):
         return None
-    
-    return token_data["user_id"]
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) <= time.time() or is_revoked(claims.get("jti")):
+        return None
+    return claims
+
+def verify_token(token: str) -> Optional[str]:
+    """Verify token and return user_id"""
+    claims = decode_token(token)
+    return claims["sub"] if claims else None
+
+def is_revoked(jti: Optional[str]) -> bool:
+    exp = revoked_tokens.get(jti)
+    return exp is not None and exp > time.time()
+
+def _remember_revoked(jti: str, exp: float):
+    if exp > time.time():
+        revoked_tokens[jti] = exp
+
+async def _on_revoke(channel: str, payload: str):
+    data = json.loads(payload)
+    _remember_revoked(data["jti"], data["exp"])
+
+async def load_revoked_tokens():
+    """Replace the local denylist with the unexpired rows of revoked_tokens"""
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+        result = await db.execute(select(RevokedToken.jti, RevokedToken.expires_at))
+        await db.commit()
+        rows = result.all()
+    loaded = {jti: expires_at.replace(tzinfo=timezone.utc).timestamp() for jti, expires_at in rows}
+    # Keep revocations received while the query ran
+    loaded.update((jti, exp) for jti, exp in revoked_tokens.items() if exp > time.time())
+    revoked_tokens.clear()
+    revoked_tokens.update(loaded)
+
+async def _sync_revoked_tokens():
+    while True:
+        await asyncio.sleep(REVOKED_TOKENS_SYNC_SECONDS)
+        try:
+            await load_revoked_tokens()
+        except Exception as e:
+            print(f"❌ Revoked token sync error: {e}")
+
+async def start_token_revocation(broker: Broker):
+    """Load the denylist and receive revocations published by other workers"""
+    global _broker, _sync_task
+    _broker = broker
+    broker.add_channel_handler(REVOKE_CHANNEL, _on_revoke)
+    await broker.subscribe(REVOKE_CHANNEL)
+    try:
+        await load_revoked_tokens()
+    except Exception as e:
+        print(f"❌ Could not load revoked tokens, retrying in {REVOKED_TOKENS_SYNC_SECONDS}s: {e}")
+    if _sync_task is None:
+        _sync_task = asyncio.create_task(_sync_revoked_tokens())
+
+def stop_token_revocation():
+    global _sync_task
+    if _sync_task:
+        _sync_task.cancel()
+        _sync_task = None
+
+async def revoke_token(db: AsyncSession, token: str) -> bool:
+    """Revoke a token in every worker (and across restarts) until it expires"""
+    claims = decode_token(token)
+    if not claims:
+        return False
+    await db.execute(
+        pg_insert(RevokedToken)
+        .values(jti=claims["jti"], expires_at=datetime.utcfromtimestamp(claims["exp"]))
+        .on_conflict_do_nothing()
+    )
+    await db.commit()
+    _remember_revoked(claims["jti"], claims["exp"])
+    if _broker is not None:
+        await _broker.publish(REVOKE_CHANNEL, json.dumps({"jti": claims["jti"], "exp": claims["exp"]}))
+    return True
+
+async def get_user_by_id(db: AsyncSession, user_id: str) -> Optional[User]:
+    """Load a user by id, served from the user cache when possible"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    result = await db.execute(select(User).where(User.id == UUID(user_id)))
+    user = result.scalar_one_or_none()
+    if user is not None:
+        # Detach so the cached instance never goes back to a (closed) session
+        db.expunge(user)
+        user_cache.set(user_id, user)
+    return user
 
-def get_current_user(
+async def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
     """Get current user from token (optional)"""
     if not credentials:
@@ -46,12 +181,12 @@ def get_current_user(
     if not user_id:
         return None
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await get_user_by_id(db, user_id)
     return user
 
-def require_auth(
+async def require_auth(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Require authentication - raises 401 if not authenticated"""
     if not credentials:
@@ -69,7 +204,7 @@ def require_auth(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,54 @@
+from typing import Iterable, List, Optional
+import hashlib
+import json
+
+from fastapi import Request, Response
+
+from .pagination import NEXT_CURSOR_HEADER
+
+# Poll responses always revalidate; clients keep them and send If-None-Match
+CACHE_CONTROL = "no-cache"
+
+def poll_etag(version: Optional[int]) -> Optional[str]:
+    """Strong ETag of a poll at a stored version (None if the version is unknown)"""
+    return f'"{version}"' if version is not None else None
+
+def feed_etag(payloads: List[dict], next_cursor: Optional[str]) -> str:
+    """
+    ETag of a feed page: the ids and versions of its polls plus the next
+    cursor, or the body itself when some poll's version is unknown
+    """
+    if all(payload.get("version") is not None for payload in payloads):
+        parts = [f"{payload['id']}:{payload['version']}" for payload in payloads]
+        raw = ",".join(parts) + f"|{next_cursor or ''}"
+    else:
+        raw = json.dumps([payloads, next_cursor], sort_keys=True, default=str)
+    return '"f-' + hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+def _parse_if_none_match(header: str) -> Iterable[str]:
+    for tag in header.split(","):
+        tag = tag.strip()
+        # Weak comparison, as If-None-Match requires
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            yield tag
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Whether the request's If-None-Match names this ETag (or "*")"""
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    return any(tag == "*" or tag == etag for tag in _parse_if_none_match(header))
+
+def cache_headers(etag: Optional[str], next_cursor: Optional[str] = None) -> dict:
+    """Cache-Control and ETag headers, plus the next page cursor if there is one"""
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if etag is not None:
+        headers["ETag"] = etag
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return headers
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -1,17 +1,29 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
 import json
 import os
 from uuid import UUID
 
-from .database import get_db
+from .auth import start_token_revocation, stop_token_revocation
+from .metrics import MetricsMiddleware, render as render_metrics
+from .pagination import NEXT_CURSOR_HEADER
+from .profiler import PROFILE_HEADER, SQLProfilerMiddleware
 from .websocket_manager import manager
+from .ws_protocol import encode, negotiate_format
 from .routes import polls, votes, likes, auth, comments
-from .services.poll_service import get_poll
+from .services.poll_service import get_poll_snapshot, get_poll_snapshots
+from .services.realtime_service import aggregator
+from .services.counter_buffer import counter_buffer
+from .services.password_service import password_hasher
+from .services.response_cache import poll_cache
+from .services.trending_service import trending
 
 app = FastAPI(title="QuickPoll API", version="1.0.0")
 
+# Polls one multiplexed /ws connection may follow at once
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))
+
 # CORS configuration - get origins from environment variable
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 
@@ -21,7 +33,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browsers read the pagination cursor
+    expose_headers=[NEXT_CURSOR_HEADER, PROFILE_HEADER, "Retry-After"],
 )
+# Opt-in (SQL_PROFILER); passes requests straight through otherwise
+app.add_middleware(SQLProfilerMiddleware)
+# Outermost, so latency covers CORS handling too
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(auth.router)
@@ -30,56 +48,76 @@ app.include_router(votes.router)
 app.include_router(likes.router)
 app.include_router(comments.router)
 
+@app.on_event("startup")
+async def startup():
+    await manager.start()
+    await start_token_revocation(manager.broker)
+    aggregator.start()
+    counter_buffer.start()
+    password_hasher.start()
+    await trending.seed()
+
+@app.on_event("shutdown")
+async def shutdown():
+    password_hasher.stop()
+    stop_token_revocation()
+    await counter_buffer.stop()
+    await aggregator.stop()
+    await manager.stop()
+
 @app.get("/")
 def read_root():
     return {"message": "QuickPoll API", "version": "1.0.0"}
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "password_hashing": password_hasher.stats(),
+        "response_cache": poll_cache.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics of this worker process"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.websocket("/ws/poll/{poll_id}")
-async def websocket_endpoint(websocket: WebSocket, poll_id: str, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, poll_id: str):
     """
     WebSocket endpoint for real-time poll updates
-    Clients connect to receive live vote and like updates
+    Clients connect to receive live vote and like updates, as JSON text frames
+    or, with the quickpoll.msgpack.v1 subprotocol or ?format=msgpack, as
+    compact MessagePack binary frames (see ws_protocol.py).
+    No database session is held by the socket; the snapshot comes from the
+    shared poll cache.
     """
-    await manager.connect(websocket, poll_id)
+    frame_format, subprotocol = negotiate_format(websocket)
+    try:
+        poll_id = str(UUID(poll_id))
+    except ValueError:
+        # Rejected before joining, so the id never names a room or a channel
+        await websocket.accept(subprotocol=subprotocol)
+        frame = encode({"type": "error", "message": "Invalid poll id"}, frame_format)
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await manager.connect(websocket, poll_id, frame_format, subprotocol)
     
     try:
         # Send initial poll data
         try:
-            poll = get_poll(db, UUID(poll_id))
-            if poll:
-                poll_data = {
-                    "type": "initial_data",
-                    "poll": {
-                        "id": str(poll.id),
-                        "title": poll.title,
-                        "description": poll.description,
-                        "category": poll.category,
-                        "created_at": poll.created_at.isoformat() if poll.created_at else None,
-                        "expires_at": poll.expires_at.isoformat() if poll.expires_at else None,
-                        "is_active": poll.is_active,
-                        "total_votes": poll.total_votes,
-                        "total_likes": poll.total_likes,
-                        "total_comments": poll.total_comments,
-                        "creator_id": str(poll.creator_id),
-                        "options": [
-                            {
-                                "id": str(opt.id),
-                                "option_text": opt.option_text,
-                                "vote_count": opt.vote_count,
-                                "position": opt.position
-                            }
-                            for opt in sorted(poll.options, key=lambda x: x.position)
-                        ]
-                    },
-                    "viewer_count": manager.get_viewer_count(poll_id)
-                }
-                await websocket.send_json(poll_data)
+            payload = await get_poll_snapshot(poll_id)
+            if payload is not None:
+                await send_initial_data(websocket, payload)
+            else:
+                await manager.leave(websocket, poll_id)
+                await manager.send_json(websocket, {"type": "error", "poll_id": poll_id, "message": "Poll not found"})
         except Exception as e:
-            await websocket.send_json({"type": "error", "message": str(e)})
+            await manager.send_json(websocket, {"type": "error", "message": str(e)})
         
         # Keep connection alive and handle incoming messages
         while True:
@@ -87,15 +125,94 @@ async def websocket_endpoint(websocket: WebSocket, poll_id: str, db: Session = D
             
             # Handle ping/pong for keep-alive
             if data == "ping":
-                await websocket.send_text("pong")
+                await manager.send_text(websocket, "pong")
+            
+    except WebSocketDisconnect:
+        await manager.disconnect(websocket, poll_id)
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+        await manager.disconnect(websocket, poll_id)
+
+async def send_initial_data(websocket: WebSocket, payload: dict):
+    """Send a poll snapshot, which also fixes the option indices of compact frames"""
+    poll_id = payload["id"]
+    manager.set_option_index(poll_id, payload["options"])
+    await manager.send_json(websocket, {
+        "type": "initial_data",
+        "poll_id": poll_id,
+        "poll": payload,
+        "viewer_count": manager.get_viewer_count(poll_id)
+    })
+
+@app.websocket("/ws")
+async def multiplexed_websocket_endpoint(websocket: WebSocket):
+    """
+    One WebSocket for live updates of many polls, e.g. a feed page. Clients
+    send {"type": "subscribe", "poll_ids": [...]} and
+    {"type": "unsubscribe", "poll_ids": [...]} text messages; every frame
+    carries the poll_id it belongs to, and each new subscription starts with
+    that poll's initial_data. Frame formats are negotiated as on /ws/poll/{id}.
+    """
+    frame_format, subprotocol = negotiate_format(websocket)
+    await manager.connect(websocket, None, frame_format, subprotocol, multiplexed=True)
+    
+    try:
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                await manager.send_text(websocket, "pong")
+                continue
             
+            try:
+                message = json.loads(data)
+                poll_ids = message.get("poll_ids") or []
+                if message.get("poll_id"):
+                    poll_ids.append(message["poll_id"])
+                poll_ids = [str(UUID(poll_id)) for poll_id in poll_ids]
+            except (AttributeError, TypeError, ValueError):
+                await manager.send_json(websocket, {"type": "error", "message": "Invalid message"})
+                continue
+            
+            if message.get("type") == "subscribe":
+                await subscribe_polls(websocket, poll_ids)
+            elif message.get("type") == "unsubscribe":
+                for poll_id in poll_ids:
+                    await manager.leave(websocket, poll_id)
+            else:
+                await manager.send_json(websocket, {"type": "error", "message": "Unknown message type"})
+    
     except WebSocketDisconnect:
-        manager.disconnect(websocket, poll_id)
-        # Broadcast updated viewer count
-        await manager.broadcast_viewer_count(poll_id)
+        await manager.disconnect(websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(websocket, poll_id)
+        await manager.disconnect(websocket)
+
+async def subscribe_polls(websocket: WebSocket, poll_ids: list):
+    """Join the rooms of new poll ids and send their snapshots, loading misses in one query"""
+    subscribed = manager.subscriptions(websocket)
+    new_ids = [poll_id for poll_id in dict.fromkeys(poll_ids) if poll_id not in subscribed]
+    if len(subscribed) + len(new_ids) > WS_MAX_SUBSCRIPTIONS:
+        await manager.send_json(websocket, {
+            "type": "error",
+            "message": f"At most {WS_MAX_SUBSCRIPTIONS} polls can be followed per connection"
+        })
+        return
+    
+    # Joined before the snapshot is read so no update in between is missed
+    for poll_id in new_ids:
+        await manager.join(websocket, poll_id)
+    try:
+        payloads = await get_poll_snapshots(new_ids)
+    except Exception as e:
+        await manager.send_json(websocket, {"type": "error", "message": str(e)})
+        return
+    for poll_id in new_ids:
+        payload = payloads[poll_id]
+        if payload is None:
+            await manager.leave(websocket, poll_id)
+            await manager.send_json(websocket, {"type": "error", "poll_id": poll_id, "message": "Poll not found"})
+        else:
+            await send_initial_data(websocket, payload)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,240 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+# Metrics are kept per process and exposed in the Prometheus text format by
+# GET /metrics; run one scrape target per worker to see every process.
+
+# Seconds; covers sub-millisecond cache hits up to slow bcrypt-bound requests
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(k)} {_number(v)}" for k, v in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """A gauge read at scrape time from a callback returning a number or {label values: number}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.read()
+        except Exception:
+            # A component that is not started yet has nothing to report
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{self._format_labels(k if isinstance(k, tuple) else (k,))} {_number(v)}"
+            for k, v in values.items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                le = 'le="' + ("+Inf" if bound == math.inf else _number(bound)) + '"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry: List[Metric] = []
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+# Per-request database work, collected by engine events in database.py
+
+class RequestDbStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, labelled by route template
+    (e.g. /polls/{poll_id}) so ids do not explode the label set, along with
+    the number and duration of database statements it ran.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDbStats()
+        token = request_db_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_db_stats.reset(token)
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=path, status=status)
+            HTTP_DB_QUERIES.observe(stats.queries, method=method, route=path)
+            HTTP_DB_SECONDS.observe(stats.seconds, method=method, route=path)
+
+
+# HTTP (main.py)
+HTTP_REQUEST_SECONDS = Histogram(
+    "quickpoll_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+HTTP_DB_QUERIES = Histogram(
+    "quickpoll_http_request_db_queries", "Database statements executed per HTTP request",
+    ("method", "route"), COUNT_BUCKETS,
+)
+HTTP_DB_SECONDS = Histogram(
+    "quickpoll_http_request_db_seconds", "Time spent in database statements per HTTP request",
+    ("method", "route"),
+)
+
+# Database (database.py)
+DB_QUERIES = Counter("quickpoll_db_queries_total", "Database statements executed")
+DB_QUERY_SECONDS = Histogram("quickpoll_db_query_duration_seconds", "Database statement latency")
+DB_POOL_WAIT_SECONDS = Histogram(
+    "quickpoll_db_pool_checkout_wait_seconds", "Time to check out a pooled connection, including waiting for one or opening it"
+)
+
+# WebSockets (websocket_manager.py)
+WS_SEND_SECONDS = Histogram(
+    "quickpoll_ws_send_latency_seconds", "Time from queueing a frame for a viewer until it is sent"
+)
+WS_FANOUT_SECONDS = Histogram(
+    "quickpoll_ws_fanout_duration_seconds", "Time to queue one message on every local viewer of a room"
+)
+WS_FANOUT_RECIPIENTS = Histogram(
+    "quickpoll_ws_fanout_recipients", "Local viewers a message was queued for", buckets=COUNT_BUCKETS + (500, 1000, 5000)
+)
+WS_DROPPED_SENDS = Counter(
+    "quickpoll_ws_dropped_sends_total", "Frames that could not be delivered and dropped their viewer", ("reason",)
+)
+
+# Real-time updates (realtime_service.py)
+REALTIME_FLUSH_SECONDS = Histogram(
+    "quickpoll_realtime_flush_duration_seconds", "Time to publish one tick of coalesced poll_delta frames"
+)
+REALTIME_FRAMES = Counter("quickpoll_realtime_frames_total", "Coalesced poll_delta frames published")
+REALTIME_OVERSIZED = Counter(
+    "quickpoll_realtime_oversized_total", "Room messages too large for the pub/sub backend, split or sent as refetch", ("outcome",)
+)
+VOTES = Counter("quickpoll_votes_total", "Votes created or changed")
+LIKES = Counter("quickpoll_likes_total", "Likes toggled (like or unlike)")
+COMMENTS = Counter("quickpoll_comments_total", "Comments posted")
+
+# Rate limiting (rate_limit.py)
+RATE_LIMITED = Counter("quickpoll_rate_limited_total", "Requests rejected with 429 by a rate limit", ("route",))
+LOAD_SHED = Counter("quickpoll_load_shed_total", "Requests rejected with 503 while the database pool was congested", ("route",))
+
+# Password hashing (password_service.py)
+PASSWORD_HASH_SECONDS = Histogram(
+    "quickpoll_password_hash_duration_seconds", "Time for a bcrypt job, including waiting for a worker", ("operation",)
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "quickpoll_password_hash_rejected_total", "bcrypt jobs turned away with 503 because the queue was full", ("operation",)
+)
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, Text, UniqueConstraint, Index
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, String, Integer, Boolean, ForeignKey, DateTime, Text, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 import uuid
 from .database import Base
@@ -30,17 +30,35 @@ class Poll(Base):
     total_votes = Column(Integer, default=0)
     total_likes = Column(Integer, default=0)
     total_comments = Column(Integer, default=0)  # New field for comment count
+    # Bumped by every write that changes the poll's payload; served as its ETag
+    version = Column(BigInteger, nullable=False, default=1, server_default="1")
+    # Title (weight A) + description (weight B), kept current by the
+    # polls_search_vector_update trigger; deferred so feed reads never load it
+    search_vector = deferred(Column(TSVECTOR))
     
     creator = relationship("User", back_populates="polls")
-    options = relationship("PollOption", back_populates="poll", cascade="all, delete-orphan")
+    # Options are always loaded explicitly (see poll_service) and in display order;
+    # raise_on_sql turns an accidental per-poll lazy load into an error
+    options = relationship(
+        "PollOption", back_populates="poll", cascade="all, delete-orphan",
+        order_by="PollOption.position", lazy="raise_on_sql"
+    )
     votes = relationship("Vote", back_populates="poll", cascade="all, delete-orphan")
     likes = relationship("PollLike", back_populates="poll", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="poll", cascade="all, delete-orphan")
     
     __table_args__ = (
-        Index('idx_polls_active', 'is_active', postgresql_where=(is_active == True)),
-        Index('idx_polls_created', 'created_at'),
-        Index('idx_polls_category', 'category'),
+        # Keyset feed indexes: (sort key, id) per sort mode, active polls only
+        Index('idx_polls_feed_created', 'created_at', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_feed_votes', 'total_votes', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_feed_likes', 'total_likes', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_feed_comments', 'total_comments', 'id', postgresql_where=(is_active == True)),
+        # Same per category, so category feeds are a top-N range scan too
+        Index('idx_polls_feed_category_created', 'category', 'created_at', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_feed_category_votes', 'category', 'total_votes', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_feed_category_likes', 'category', 'total_likes', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_feed_category_comments', 'category', 'total_comments', 'id', postgresql_where=(is_active == True)),
+        Index('idx_polls_search', 'search_vector', postgresql_using='gin'),
     )
 
 class Comment(Base):
@@ -56,8 +74,8 @@ class Comment(Base):
     poll = relationship("Poll", back_populates="comments")
     
     __table_args__ = (
-        Index('idx_comments_poll', 'poll_id'),
-        Index('idx_comments_created', 'created_at'),
+        # Newest-first keyset pages of one poll's comments
+        Index('idx_comments_poll_created', 'poll_id', 'created_at', 'id'),
     )
 
 class PollOption(Base):
@@ -107,3 +125,14 @@ class PollLike(Base):
         UniqueConstraint('poll_id', 'user_id', name='unique_like_per_user'),
         Index('idx_likes_poll', 'poll_id'),
     )
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    
+    # Token id (jti claim); the row is only needed until the token expires
+    jti = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_revoked_tokens_expires', 'expires_at'),
+    )
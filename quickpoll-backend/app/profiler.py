@@ -0,0 +1,238 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+from .database import async_engine
+
+# Opt-in per-request SQL profiling: "header" adds an X-SQL-Profile summary to
+# every response, "log" prints it; both may be given ("header,log")
+SQL_PROFILER = {mode.strip() for mode in os.getenv("SQL_PROFILER", "").lower().split(",") if mode.strip()}
+# A statement shape run this many times by one request is flagged as N+1
+SQL_PROFILER_REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILER_REPEAT_THRESHOLD", "3"))
+# Fail requests that exceed their declared query budget with a 500
+SQL_PROFILER_STRICT = os.getenv("SQL_PROFILER_STRICT", "false").lower() == "true"
+
+PROFILE_HEADER = "X-SQL-Profile"
+
+# Bind parameter lists such as IN ($1::UUID, $2::UUID, ...) and literals
+_PARAMS = re.compile(r"\$\d+(::[\w\[\]]+)?(\s*,\s*\$\d+(::[\w\[\]]+)?)*")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """Statement text with parameters and literals replaced, so repeats of one query compare equal"""
+    shape = _PARAMS.sub("?", statement)
+    shape = _LITERALS.sub("?", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request (or a block under assert_query_budget) runs too many queries"""
+
+
+class QueryProfile:
+    """Statements run by one request, with their timings"""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.statements.append((statement, seconds))
+
+    @property
+    def queries(self) -> int:
+        return len(self.statements)
+
+    @property
+    def seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold: int = SQL_PROFILER_REPEAT_THRESHOLD) -> List[dict]:
+        """Statement shapes run at least threshold times, most frequent first"""
+        shapes: Dict[str, list] = {}
+        for statement, seconds in self.statements:
+            entry = shapes.setdefault(statement_shape(statement), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+        return sorted(
+            (
+                {"count": count, "ms": round(seconds * 1000, 2), "shape": shape}
+                for shape, (count, seconds) in shapes.items() if count >= threshold
+            ),
+            key=lambda entry: entry["count"], reverse=True,
+        )
+
+    def summary(self, shape_length: int = 120) -> dict:
+        return {
+            "queries": self.queries,
+            "ms": round(self.seconds * 1000, 2),
+            "repeated": [
+                dict(entry, shape=entry["shape"][:shape_length]) for entry in self.repeated()[:5]
+            ],
+        }
+
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_profile", default=None)
+
+# Blocks under assert_query_budget; process-wide so requests served by
+# another thread (e.g. TestClient) are still seen
+_active_budgets: List["_BudgetCheck"] = []
+_install_lock = threading.Lock()
+_installed = False
+
+def install():
+    """Attach the statement listeners to the engine (once)"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        event.listen(async_engine.sync_engine, "before_cursor_execute", _before_execute)
+        event.listen(async_engine.sync_engine, "after_cursor_execute", _after_execute)
+        _installed = True
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiler_started = time.perf_counter()
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._profiler_started
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(statement, seconds)
+    elif _active_budgets:
+        # Statements outside a request (startup, background tasks) still count
+        for budget in list(_active_budgets):
+            budget.outside.record(statement, seconds)
+
+
+def query_budget(queries: int):
+    """
+    Declare the most statements a route may run per request:
+
+        @router.get("/{poll_id}")
+        @query_budget(2)
+        async def get_poll_by_id(...):
+
+    Checked by SQLProfilerMiddleware while profiling or under assert_query_budget.
+    """
+    def declare(endpoint):
+        endpoint.query_budget = queries
+        return endpoint
+    return declare
+
+
+class _BudgetCheck:
+    def __init__(self, max_queries: Optional[int], allow_repeats: bool):
+        self.max_queries = max_queries
+        self.allow_repeats = allow_repeats
+        self.outside = QueryProfile()
+        self.requests: List[Tuple[str, QueryProfile, Optional[int]]] = []
+
+    def add_request(self, name: str, profile: QueryProfile, budget: Optional[int]):
+        self.requests.append((name, profile, budget))
+
+    def failures(self) -> List[str]:
+        failures = []
+        total = self.outside.queries
+        for name, profile, budget in self.requests:
+            total += profile.queries
+            if budget is not None and profile.queries > budget:
+                failures.append(f"{name} ran {profile.queries} queries, budget is {budget}")
+            if not self.allow_repeats:
+                for entry in profile.repeated():
+                    failures.append(f"{name} ran the same statement {entry['count']} times (N+1): {entry['shape'][:200]}")
+        if self.max_queries is not None and total > self.max_queries:
+            failures.append(f"{total} queries ran, budget is {self.max_queries}")
+        return failures
+
+
+@contextmanager
+def assert_query_budget(max_queries: Optional[int] = None, allow_repeats: bool = False):
+    """
+    Fail (QueryBudgetExceeded) if the code in the block runs more than
+    max_queries statements in total, if any request it makes exceeds its
+    route's declared query_budget, or, unless allow_repeats, if a request
+    repeats a statement shape SQL_PROFILER_REPEAT_THRESHOLD times:
+
+        with assert_query_budget(2):
+            client.get("/polls/")
+    """
+    install()
+    check = _BudgetCheck(max_queries, allow_repeats)
+    _active_budgets.append(check)
+    try:
+        yield check
+    finally:
+        _active_budgets.remove(check)
+    failures = check.failures()
+    if failures:
+        raise QueryBudgetExceeded("\n".join(failures))
+
+
+class SQLProfilerMiddleware:
+    """
+    ASGI middleware recording every statement of a request while SQL_PROFILER
+    is set or a test is under assert_query_budget. Summaries (query count,
+    database time, repeated statement shapes) go to a response header and/or
+    the log, and requests over their route's query_budget are reported.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        if SQL_PROFILER:
+            install()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (SQL_PROFILER or _active_budgets):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+        header_sent = False
+
+        async def send_with_profile(message):
+            nonlocal header_sent
+            if message["type"] == "http.response.start" and "header" in SQL_PROFILER:
+                # Statements run while streaming the body are not included
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_HEADER.lower().encode(), json.dumps(profile.summary()).encode()))
+                message = dict(message, headers=headers)
+            if message["type"] == "http.response.start":
+                header_sent = True
+                self._check_budget(scope, profile)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            current_profile.reset(token)
+            if not header_sent:
+                self._check_budget(scope, profile)
+            self._report(scope, profile)
+
+    def _check_budget(self, scope, profile: QueryProfile):
+        route = scope.get("route")
+        name = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+        budget = getattr(scope.get("endpoint"), "query_budget", None)
+        for check in list(_active_budgets):
+            check.add_request(name, profile, budget)
+        if SQL_PROFILER_STRICT and budget is not None and profile.queries > budget:
+            raise QueryBudgetExceeded(f"{name} ran {profile.queries} queries, budget is {budget}")
+
+    def _report(self, scope, profile: QueryProfile):
+        if "log" not in SQL_PROFILER:
+            return
+        route = scope.get("route")
+        name = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+        budget = getattr(scope.get("endpoint"), "query_budget", None)
+        over = f" ❌ over budget of {budget}" if budget is not None and profile.queries > budget else ""
+        print(f"SQL {name}: {profile.queries} queries in {profile.seconds * 1000:.1f}ms{over}")
+        for entry in profile.repeated():
+            print(f"  ⚠️  N+1: {entry['count']}x ({entry['ms']}ms) {entry['shape'][:200]}")
@@ -0,0 +1,192 @@
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import os
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+# Called with (channel, payload) for every message published on a subscribed channel
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")  # memory, postgres
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_BYTES = 7999
+
+
+class PayloadTooLarge(ValueError):
+    """Raised when a payload can never be published by the broker, however often it is retried"""
+
+
+class Broker:
+    """
+    Pub/sub transport used to fan room messages out to every process.
+    Processes only subscribe to the channels they have local listeners for.
+    """
+
+    # Largest payload in UTF-8 bytes the backend can carry (None = no limit)
+    max_payload: Optional[int] = None
+
+    def __init__(self):
+        self.handler: Optional[MessageHandler] = None
+        # Fixed channels with their own callback instead of the room handler
+        self.channel_handlers: Dict[str, MessageHandler] = {}
+        self.channels: Set[str] = set()
+
+    def set_handler(self, handler: MessageHandler):
+        """Register the callback that receives messages for subscribed channels"""
+        self.handler = handler
+
+    def add_channel_handler(self, channel: str, handler: MessageHandler):
+        """Route messages on one channel to a dedicated callback"""
+        self.channel_handlers[channel] = handler
+
+    def handler_for(self, channel: str) -> Optional[MessageHandler]:
+        return self.channel_handlers.get(channel, self.handler)
+
+    async def start(self):
+        """Open any connections the backend needs"""
+
+    async def stop(self):
+        """Close backend connections"""
+
+    async def subscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, payload: str):
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker - delivers published messages directly"""
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    async def publish(self, channel: str, payload: str):
+        handler = self.handler_for(channel)
+        if channel in self.channels and handler:
+            await handler(channel, payload)
+
+
+class PostgresBroker(Broker):
+    """
+    Broker backed by Postgres LISTEN/NOTIFY.
+    A dedicated asyncpg connection LISTENs on subscribed channels; NOTIFY goes
+    through the regular engine pool. Payloads must stay under Postgres' 8000
+    byte NOTIFY limit; larger ones raise PayloadTooLarge.
+    """
+
+    max_payload = NOTIFY_MAX_BYTES
+
+    def __init__(self, database_url: str):
+        super().__init__()
+        # asyncpg wants a plain libpq-style DSN, not a SQLAlchemy driver URL
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.listener = None
+        # asyncpg connections run one command at a time
+        self.lock = asyncio.Lock()
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.running = False
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        self.inbox.put_nowait((channel, payload))
+
+    def _on_terminated(self, connection):
+        if self.running:
+            asyncio.create_task(self._reconnect())
+
+    async def _connect(self):
+        import asyncpg
+
+        self.listener = await asyncpg.connect(self.dsn)
+        self.listener.add_termination_listener(self._on_terminated)
+        for channel in self.channels:
+            await self.listener.add_listener(channel, self._on_notify)
+
+    async def _reconnect(self):
+        """Re-establish the listener connection and re-LISTEN all channels"""
+        async with self.lock:
+            while self.running:
+                try:
+                    await self._connect()
+                    return
+                except Exception as e:
+                    print(f"Pub/sub reconnect failed: {e}")
+                    await asyncio.sleep(1.0)
+
+    async def _dispatch(self):
+        """Hand notifications to the handler one at a time to preserve ordering"""
+        while True:
+            channel, payload = await self.inbox.get()
+            handler = self.handler_for(channel)
+            if channel not in self.channels or not handler:
+                continue
+            try:
+                await handler(channel, payload)
+            except Exception as e:
+                print(f"Pub/sub handler error: {e}")
+
+    async def start(self):
+        self.running = True
+        async with self.lock:
+            await self._connect()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        self.running = False
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+        if self.listener is not None:
+            await self.listener.close()
+            self.listener = None
+
+    async def subscribe(self, channel: str):
+        if channel in self.channels:
+            return
+        self.channels.add(channel)
+        async with self.lock:
+            if self.listener is not None and not self.listener.is_closed():
+                try:
+                    await self.listener.add_listener(channel, self._on_notify)
+                except Exception as e:
+                    # The reconnect path re-LISTENs every channel in self.channels
+                    print(f"Pub/sub subscribe error: {e}")
+
+    async def unsubscribe(self, channel: str):
+        if channel not in self.channels:
+            return
+        self.channels.discard(channel)
+        async with self.lock:
+            if self.listener is not None and not self.listener.is_closed():
+                try:
+                    await self.listener.remove_listener(channel, self._on_notify)
+                except Exception as e:
+                    print(f"Pub/sub unsubscribe error: {e}")
+
+    async def publish(self, channel: str, payload: str):
+        from .database import async_engine
+
+        size = len(payload.encode("utf-8"))
+        if size > self.max_payload:
+            raise PayloadTooLarge(f"{size} byte payload on {channel} is over the {self.max_payload} byte NOTIFY limit")
+        async with async_engine.begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+
+def create_broker() -> Broker:
+    """Build the broker selected by PUBSUB_BACKEND"""
+    if PUBSUB_BACKEND == "postgres":
+        from .database import DATABASE_URL
+        return PostgresBroker(DATABASE_URL)
+    if PUBSUB_BACKEND != "memory":
+        raise ValueError(f"Unknown PUBSUB_BACKEND: {PUBSUB_BACKEND}")
+    return InMemoryBroker()
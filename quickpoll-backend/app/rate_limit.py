@@ -0,0 +1,164 @@
+from typing import Dict, List, Optional, Tuple
+import math
+import os
+import time
+
+from fastapi import HTTPException, Request
+
+from .auth import decode_token
+from .database import async_engine
+from .metrics import LOAD_SHED, RATE_LIMITED, Gauge
+
+# Per-route token buckets as name=requests/seconds, e.g. "likes=10/10" allows
+# bursts of 10 likes and refills one every second. Routes left out are not
+# limited; RATE_LIMITS="" turns rate limiting off.
+RATE_LIMITS = os.getenv("RATE_LIMITS", "votes=30/10,votes_batch=5/10,likes=10/10,comments=5/60")
+# Buckets are spread over shards that are pruned independently
+RATE_LIMIT_SHARDS = 16
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Limited routes are shed with 503 while this many are in flight and checking
+# out a database connection takes longer than LOAD_SHED_POOL_WAIT_MS on average
+LOAD_SHED_MAX_CONCURRENT = int(os.getenv("LOAD_SHED_MAX_CONCURRENT", "60"))
+LOAD_SHED_POOL_WAIT_MS = float(os.getenv("LOAD_SHED_POOL_WAIT_MS", "100"))
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse RATE_LIMITS into route name -> (refill rate per second, burst)"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = entry.partition("=")
+        requests, _, seconds = value.partition("/")
+        try:
+            requests, seconds = float(requests), float(seconds or 1)
+        except ValueError:
+            requests = seconds = 0.0
+        if not name.strip() or not (requests > 0 and seconds > 0 and math.isfinite(requests / seconds)):
+            raise ValueError(
+                f"Invalid RATE_LIMITS entry {entry!r}: expected name=requests/seconds with positive numbers"
+            )
+        limits[name.strip()] = (requests / seconds, requests)
+    return limits
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets per key, spread over shards by key hash. A shard that grows
+    past its share of RATE_LIMIT_MAX_KEYS drops its idle (full) buckets first,
+    so pruning only ever walks one shard.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        # key -> (tokens, updated at, full again at)
+        self.shards: List[Dict[str, Tuple[float, float, float]]] = [{} for _ in range(shards)]
+        self.max_keys_per_shard = max(1, max_keys // shards)
+
+    def acquire(self, key: str, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Take a token for key; returns 0 if allowed, otherwise the seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        shard = self.shards[hash(key) % len(self.shards)]
+        tokens, updated, _ = shard.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        if key not in shard and len(shard) >= self.max_keys_per_shard:
+            self._prune(shard, now)
+        shard[key] = (tokens, now, now + (burst - tokens) / rate)
+        return wait
+
+    def _prune(self, shard: Dict[str, Tuple[float, float, float]], now: float):
+        for key in [key for key, (_, _, full_at) in shard.items() if full_at <= now]:
+            del shard[key]
+        # Still full of active keys - forget the oldest ones, which only lets them burst again
+        excess = len(shard) - int(self.max_keys_per_shard * 0.9)
+        for key in list(shard)[:max(0, excess)]:
+            del shard[key]
+
+    def size(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+
+class LoadShedder:
+    """Caps concurrent limited requests, but only while the database pool is congested"""
+
+    def __init__(self, max_concurrent: int = LOAD_SHED_MAX_CONCURRENT, pool_wait_ms: float = LOAD_SHED_POOL_WAIT_MS):
+        self.max_concurrent = max_concurrent
+        self.pool_wait = pool_wait_ms / 1000
+        self.in_flight = 0
+
+    def congested(self) -> bool:
+        return getattr(async_engine.pool, "recent_wait", 0.0) > self.pool_wait
+
+    def admit(self) -> bool:
+        if self.in_flight >= self.max_concurrent and self.congested():
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+limits = parse_limits(RATE_LIMITS)
+limiter = TokenBucketLimiter()
+shedder = LoadShedder()
+
+def client_key(request: Request) -> str:
+    """
+    The signed-in user (checked from the token alone, without a database
+    lookup) or else the client address. Behind a proxy, uvicorn's
+    --forwarded-allow-ips must trust it for the address to be the client's.
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        # Client input: a token that cannot be read only means no user key
+        try:
+            claims = decode_token(token)
+            if claims:
+                return "user:" + str(claims["sub"])
+        except Exception:
+            pass
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+def rate_limit(name: str):
+    """
+    Route dependency enforcing the RATE_LIMITS entry `name` and load shedding:
+
+        @router.post("/", dependencies=[Depends(rate_limit("likes"))])
+
+    Route dependencies are solved before the endpoint's own, so rejected
+    requests never open a database session.
+    """
+    limit = limits.get(name)
+
+    async def check(request: Request):
+        if limit is not None:
+            rate, burst = limit
+            wait = limiter.acquire(f"{name}:{client_key(request)}", rate, burst)
+            if wait:
+                RATE_LIMITED.inc(route=name)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+        if not shedder.admit():
+            LOAD_SHED.inc(route=name)
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield
+        finally:
+            shedder.release()
+
+    return check
+
+
+Gauge("quickpoll_rate_limit_keys", "Clients with a rate limit bucket", limiter.size)
+Gauge("quickpoll_load_shed_in_flight", "Requests in flight on load-shed routes", lambda: shedder.in_flight)
@@ -1,30 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-import bcrypt
+from typing import Optional
 from ..database import get_db
 from ..schemas import UserRegister, UserLogin, TokenResponse, UserResponse
 from ..models import User
 from ..auth import create_access_token
+from ..services.password_service import PASSWORD_HASH_RETRY_AFTER, HashingOverloaded, password_hasher
+from ..profiler import query_budget
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+def hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+    )
 
 @router.post("/register", response_model=TokenResponse)
-def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     try:
         # Check if user already exists
-        existing_user = db.query(User).filter(
+        result = await db.execute(select(User).where(
             (User.email == user_data.email) | (User.username == user_data.username)
-        ).first()
+        ).limit(1))
+        existing_user = result.scalar_one_or_none()
         
         if existing_user:
             raise HTTPException(
@@ -32,8 +36,8 @@ def register(user_data: UserRegister, db: Session = Depends(get_db)):
                 detail="Username or email already registered"
             )
         
-        # Create new user
-        hashed_password = hash_password(user_data.password)
+        # Create new user (bcrypt runs in the dedicated hashing pool)
+        hashed_password = await password_hasher.hash(user_data.password)
         new_user = User(
             username=user_data.username,
             email=user_data.email,
@@ -41,8 +45,8 @@ def register(user_data: UserRegister, db: Session = Depends(get_db)):
         )
         
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         
         # Create access token
         access_token = create_access_token(new_user.id)
@@ -57,24 +61,29 @@ def register(user_data: UserRegister, db: Session = Depends(get_db)):
             )
         )
         
+    except HashingOverloaded:
+        await db.rollback()
+        raise hashing_busy()
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username or email already registered"
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
 @router.post("/login", response_model=TokenResponse)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
+@query_budget(1)
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login user"""
     # Find user by email
-    user = db.query(User).filter(User.email == credentials.email).first()
+    result = await db.execute(select(User).where(User.email == credentials.email))
+    user = result.scalar_one_or_none()
     
     if not user or not user.password_hash:
         raise HTTPException(
@@ -83,7 +92,11 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
         )
     
     # Verify password
-    if not verify_password(credentials.password, user.password_hash):
+    try:
+        password_ok = await password_hasher.verify(credentials.password, user.password_hash)
+    except HashingOverloaded:
+        raise hashing_busy()
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
@@ -103,10 +116,10 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
     )
 
 # Import here to avoid circular dependency
-from ..auth import require_auth
+from ..auth import require_auth, revoke_token, security
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(user: User = Depends(require_auth)):
+async def get_current_user_info(user: User = Depends(require_auth)):
     """Get current user info"""
     return UserResponse(
         id=user.id,
@@ -114,3 +127,13 @@ def get_current_user_info(user: User = Depends(require_auth)):
         email=user.email,
         created_at=user.created_at
     )
+
+@router.post("/logout")
+async def logout(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    user: User = Depends(require_auth),
+    db: AsyncSession = Depends(get_db)
+):
+    """Revoke the presented token"""
+    await revoke_token(db, credentials.credentials)
+    return {"message": "Logged out"}
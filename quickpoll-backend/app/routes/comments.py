@@ -1,25 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional
 from uuid import UUID
 from ..database import get_db
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from ..schemas import CommentCreate, CommentResponse
 from ..models import Comment, Poll, User
 from ..auth import get_current_user
-from ..services.realtime_service import broadcast_comment_update
+from ..services.realtime_service import broadcast_comment_update, broadcast_comment_count_update
+from ..profiler import query_budget
+from ..rate_limit import rate_limit
 
 router = APIRouter(prefix="/comments", tags=["comments"])
 
-@router.post("/", response_model=CommentResponse)
+@router.post("/", response_model=CommentResponse, dependencies=[Depends(rate_limit("comments"))])
+@query_budget(5)
 async def create_comment(
     comment: CommentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new comment (authenticated users can choose to post anonymously)"""
     try:
         # Check if poll exists
-        poll = db.query(Poll).filter(Poll.id == comment.poll_id).first()
+        poll = await db.get(Poll, comment.poll_id)
         if not poll:
             raise HTTPException(status_code=404, detail="Poll not found")
         
@@ -41,13 +47,27 @@ async def create_comment(
         
         db.add(new_comment)
         
-        # Increment total_comments on poll
-        poll.total_comments += 1
+        # Increment total_comments on poll and bump its version
+        result = await db.execute(
+            update(Poll)
+            .where(Poll.id == comment.poll_id)
+            .values(total_comments=Poll.total_comments + 1, version=Poll.version + 1)
+            .returning(Poll.total_comments, Poll.version)
+        )
+        total_comments, version = result.one()
         
-        db.commit()
-        db.refresh(new_comment)
+        await db.commit()
+        await db.refresh(new_comment)
         
-        # Broadcast new comment via WebSocket
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        print(f"Comment create error: {e}")
+        raise HTTPException(status_code=400, detail="Could not create comment")
+    
+    # The comment is saved; a failed broadcast must not make the client retry it
+    try:
         await broadcast_comment_update(
             comment.poll_id,
             {
@@ -55,51 +75,90 @@ async def create_comment(
                 "username": new_comment.username,
                 "comment_text": new_comment.comment_text,
                 "created_at": new_comment.created_at.isoformat(),
-            }
+            },
+            total_comments,
+            version
         )
-        
-        return new_comment
-        
-    except HTTPException:
-        raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+        print(f"Comment broadcast error: {e}")
+    
+    return new_comment
+
+# Largest page a client may ask for
+MAX_COMMENTS_PAGE = 100
 
 @router.get("/poll/{poll_id}", response_model=List[CommentResponse])
-def get_poll_comments(poll_id: UUID, db: Session = Depends(get_db)):
-    """Get all comments for a poll"""
-    comments = db.query(Comment).filter(
-        Comment.poll_id == poll_id
-    ).order_by(Comment.created_at.desc()).all()
+@query_budget(1)
+async def get_poll_comments(
+    poll_id: UUID,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get comments for a poll, newest first, one page at a time.
+    Pass the X-Next-Cursor header of a response as `cursor` for the next page.
+    """
+    limit = max(1, min(limit, MAX_COMMENTS_PAGE))
+    query = select(Comment).where(Comment.poll_id == poll_id)
+    
+    if cursor:
+        try:
+            created_at, comment_id = decode_cursor(cursor)
+            query = query.where(
+                tuple_(Comment.created_at, Comment.id) < tuple_(datetime.fromisoformat(created_at), UUID(comment_id))
+            )
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Served by idx_comments_poll_created (poll_id, created_at, id)
+    result = await db.execute(
+        query.order_by(Comment.created_at.desc(), Comment.id.desc()).limit(limit + 1)
+    )
+    comments = result.scalars().all()
+    
+    if len(comments) > limit:
+        comments = comments[:limit]
+        last = comments[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at.isoformat(), last.id)
     
     return comments
 
 @router.delete("/{comment_id}")
-def delete_comment(
+async def delete_comment(
     comment_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete a comment (only creator or poll owner can delete)"""
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    comment = db.query(Comment).filter(Comment.id == comment_id).first()
+    comment = await db.get(Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
     # Check if user is comment creator or poll owner
-    poll = db.query(Poll).filter(Poll.id == comment.poll_id).first()
+    poll = await db.get(Poll, comment.poll_id)
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
     if comment.user_id != current_user.id and poll.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
     
-    db.delete(comment)
+    await db.delete(comment)
+    
+    # Decrement total_comments on poll and bump its version
+    result = await db.execute(
+        update(Poll)
+        .where(Poll.id == poll.id)
+        .values(total_comments=func.greatest(Poll.total_comments - 1, 0), version=Poll.version + 1)
+        .returning(Poll.total_comments, Poll.version)
+    )
+    total_comments, version = result.one()
     
-    # Decrement total_comments on poll
-    if poll.total_comments > 0:
-        poll.total_comments -= 1
+    await db.commit()
     
-    db.commit()
+    await broadcast_comment_count_update(poll.id, total_comments, version)
     
     return {"message": "Comment deleted successfully"}
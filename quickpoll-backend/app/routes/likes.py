@@ -1,66 +1,108 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from ..database import get_db
 from ..schemas import LikeCreate, LikeResponse
 from ..models import PollLike, Poll
 from ..services.realtime_service import broadcast_like_update
+from ..services.counter_buffer import counter_buffer
+from ..profiler import query_budget
+from ..rate_limit import rate_limit
 
 router = APIRouter(prefix="/likes", tags=["likes"])
 
-@router.post("/", response_model=dict)
-async def toggle_like(like: LikeCreate, db: Session = Depends(get_db)):
+def buffered_total_likes(poll: Poll) -> int:
+    """Stored like count plus any likes still waiting in the counter buffer"""
+    if not counter_buffer.enabled:
+        return poll.total_likes
+    return max(0, poll.total_likes + counter_buffer.delta(poll.id)["total_likes"])
+
+async def apply_like_change(db: AsyncSession, poll: Poll, change: int):
+    """
+    Apply a like change to the poll's counter; returns (total_likes, version),
+    version being None while the change waits in the counter buffer
+    """
+    if counter_buffer.enabled:
+        # Buffered only once the like change is committed, so a failed
+        # commit leaves no phantom delta
+        await db.commit()
+        counter_buffer.add_like(poll.id, change)
+        return buffered_total_likes(poll), None
+    # One atomic UPDATE, so concurrent toggles neither lose counts nor versions
+    result = await db.execute(
+        update(Poll)
+        .where(Poll.id == poll.id)
+        .values(total_likes=func.greatest(Poll.total_likes + change, 0), version=Poll.version + 1)
+        .returning(Poll.total_likes, Poll.version)
+    )
+    total_likes, version = result.one()
+    await db.commit()
+    return total_likes, version
+
+@router.post("/", response_model=dict, dependencies=[Depends(rate_limit("likes"))])
+@query_budget(4)
+async def toggle_like(like: LikeCreate, db: AsyncSession = Depends(get_db)):
     """
     Toggle like on a poll
     If already liked, remove like. Otherwise, add like.
     """
     try:
         # Check if poll exists
-        poll = db.query(Poll).filter(Poll.id == like.poll_id).first()
+        poll = await db.get(Poll, like.poll_id)
         if not poll:
             raise HTTPException(status_code=404, detail="Poll not found")
         
         # Check if user already liked
-        existing_like = db.query(PollLike).filter(
+        result = await db.execute(select(PollLike).where(
             and_(PollLike.poll_id == like.poll_id, PollLike.user_id == like.user_id)
-        ).first()
+        ))
+        existing_like = result.scalar_one_or_none()
         
+        # The delete/insert report whether they changed a row, so a concurrent
+        # toggle by the same user that got there first is not counted twice
         if existing_like:
             # Remove like
-            db.delete(existing_like)
-            poll.total_likes = max(0, poll.total_likes - 1)
-            db.commit()
-            
-            # Broadcast update
-            await broadcast_like_update(like.poll_id, poll.total_likes)
-            
-            return {"liked": False, "total_likes": poll.total_likes}
+            result = await db.execute(
+                delete(PollLike).where(PollLike.id == existing_like.id).returning(PollLike.id)
+            )
+            liked = False
+            change = -1 if result.first() is not None else 0
         else:
             # Add like
-            new_like = PollLike(
-                poll_id=like.poll_id,
-                user_id=like.user_id
+            result = await db.execute(
+                pg_insert(PollLike)
+                .values(poll_id=like.poll_id, user_id=like.user_id)
+                .on_conflict_do_nothing()
+                .returning(PollLike.id)
             )
-            db.add(new_like)
-            poll.total_likes += 1
-            db.commit()
-            
-            # Broadcast update
-            await broadcast_like_update(like.poll_id, poll.total_likes)
-            
-            return {"liked": True, "total_likes": poll.total_likes}
+            liked = True
+            change = 1 if result.first() is not None else 0
+        
+        if not change:
+            await db.commit()
+            return {"liked": liked, "total_likes": buffered_total_likes(poll)}
+        
+        total_likes, version = await apply_like_change(db, poll, change)
+        
+        # Broadcast update
+        await broadcast_like_update(like.poll_id, total_likes, version)
+        
+        return {"liked": liked, "total_likes": total_likes}
             
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/poll/{poll_id}/user/{user_id}")
-def check_user_like(poll_id: UUID, user_id: UUID, db: Session = Depends(get_db)):
+@query_budget(1)
+async def check_user_like(poll_id: UUID, user_id: UUID, db: AsyncSession = Depends(get_db)):
     """Check if user has liked a poll"""
-    like = db.query(PollLike).filter(
+    result = await db.execute(select(PollLike).where(
         and_(PollLike.poll_id == poll_id, PollLike.user_id == user_id)
-    ).first()
+    ))
+    like = result.scalar_one_or_none()
     return {"liked": like is not None}
@@ -1,19 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from uuid import UUID
 from ..database import get_db
 from ..schemas import PollCreate, PollResponse
-from ..services.poll_service import create_poll, get_poll, get_all_polls, delete_poll
+from ..etag import cache_headers, etag_matches, feed_etag, not_modified, poll_etag
+from ..pagination import decode_cursor, encode_cursor
+from ..services.poll_service import (
+    create_poll, get_poll, get_poll_version, get_polls, get_polls_by_ids, get_polls_page, get_all_polls, delete_poll
+)
 from ..models import User, Poll as PollModel
 from ..auth import require_auth
+from ..services.counter_buffer import counter_buffer
+from ..services.response_cache import poll_cache
+from ..services.trending_service import trending
+from ..profiler import query_budget
 
 router = APIRouter(prefix="/polls", tags=["polls"])
 
 @router.post("/", response_model=PollResponse)
-def create_new_poll(
+async def create_new_poll(
     poll: PollCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_auth)
 ):
     """Create a new poll (requires authentication)"""
@@ -26,7 +35,7 @@ def create_new_poll(
             category=poll.category
         )
         db.add(new_poll)
-        db.flush()
+        await db.flush()
         
         # Add options
         from ..models import PollOption
@@ -38,45 +47,91 @@ def create_new_poll(
             )
             db.add(option)
         
-        db.commit()
-        db.refresh(new_poll)
+        await db.commit()
+        await db.refresh(new_poll, attribute_names=["options"])
+        poll_cache.invalidate_feeds()
+        trending.add_poll(new_poll.id, new_poll.category, new_poll.created_at)
         return new_poll
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/", response_model=List[PollResponse])
-def list_polls(
+@query_budget(2)
+async def list_polls(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
-    sort_by: str = "created_at",  # created_at, votes, likes, comments
+    sort_by: str = "created_at",  # created_at, votes, likes, comments, relevance, trending
     category: str = None,
     search: str = None,
-    db: Session = Depends(get_db)
+    search_description: bool = False,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get all active polls with sorting, filtering, and search"""
-    query = db.query(PollModel).filter(PollModel.is_active == True)
+    """
+    Get all active polls with sorting, filtering, and search.
+    Search matches word prefixes in titles (and descriptions with
+    search_description=true); sort_by=relevance ranks the matches.
+    sort_by=trending reads the in-memory time-decayed ranking (ignored when searching).
+    Pages are keyset-paginated: pass the X-Next-Cursor header of a response as
+    `cursor` to get the next page. `skip` still selects offset paging.
+    Pages carry an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    if sort_by == "trending" and not search:
+        return await trending_feed(request, db, category, cursor, limit)
     
-    # Filter by category
-    if category and category != "All":
-        query = query.filter(PollModel.category == category)
+    key = poll_cache.feed_key(sort_by, category, search, search_description, cursor, skip, limit)
+    page = poll_cache.get_feed(key)
+    if page is None:
+        next_cursor = None
+        if skip:
+            polls = await get_polls(db, skip, limit, sort_by, category, search, search_description)
+        else:
+            try:
+                polls, next_cursor = await get_polls_page(
+                    db, limit, sort_by, category, search, cursor, search_description
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        page = (poll_cache.put_feed(key, [counter_buffer.overlay(poll) for poll in polls], next_cursor), next_cursor)
     
-    # Search by title
-    if search:
-        query = query.filter(PollModel.title.ilike(f"%{search}%"))
+    payloads, next_cursor = page
+    return feed_response(request, payloads, next_cursor)
+
+def feed_response(request: Request, payloads: List[dict], next_cursor: Optional[str]):
+    """A feed page, or 304 if the client already has it"""
+    etag = feed_etag(payloads, next_cursor)
+    headers = cache_headers(etag, next_cursor)
+    if etag_matches(request, etag):
+        return not_modified(headers)
+    return JSONResponse(payloads, headers=headers)
+
+async def trending_feed(
+    request: Request,
+    db: AsyncSession,
+    category: Optional[str],
+    cursor: Optional[str],
+    limit: int
+):
+    """One page of the in-memory trending ranking; polls come from the cache or by primary key"""
+    offset = 0
+    if cursor:
+        try:
+            mode, offset = decode_cursor(cursor)
+            if mode != "trending" or not isinstance(offset, int) or offset < 0:
+                raise ValueError()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    # Sort
-    if sort_by == "votes":
-        query = query.order_by(PollModel.total_votes.desc())
-    elif sort_by == "likes":
-        query = query.order_by(PollModel.total_likes.desc())
-    elif sort_by == "comments":
-        query = query.order_by(PollModel.total_comments.desc())
-    else:  # created_at (default)
-        query = query.order_by(PollModel.created_at.desc())
+    poll_ids, next_offset = trending.page(category, offset, limit)
+    payloads = {poll_id: poll_cache.get_poll(poll_id) for poll_id in poll_ids}
+    missing = [UUID(poll_id) for poll_id, payload in payloads.items() if payload is None]
+    for poll in await get_polls_by_ids(db, missing):
+        payloads[str(poll.id)] = poll_cache.put_poll(counter_buffer.overlay(poll))
     
-    polls = query.offset(skip).limit(limit).all()
-    return polls
+    next_cursor = encode_cursor("trending", next_offset) if next_offset is not None else None
+    return feed_response(request, [payloads[poll_id] for poll_id in poll_ids if payloads[poll_id] is not None], next_cursor)
 
 @router.get("/categories", response_model=List[str])
 def get_categories():
@@ -93,28 +148,48 @@ def get_categories():
     ]
 
 @router.get("/{poll_id}", response_model=PollResponse)
-def get_poll_by_id(poll_id: UUID, db: Session = Depends(get_db)):
-    """Get a specific poll by ID"""
-    poll = get_poll(db, poll_id)
-    if not poll:
-        raise HTTPException(status_code=404, detail="Poll not found")
-    return poll
+@query_budget(3)
+async def get_poll_by_id(poll_id: UUID, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Get a specific poll by ID. The ETag is the poll's version; a matching
+    If-None-Match gets 304 Not Modified. There is no ETag while the counts
+    include changes the counter buffer has not written yet.
+    """
+    payload = poll_cache.get_poll(poll_id)
+    if payload is None:
+        # Revalidating clients are answered from the version column alone
+        if request.headers.get("if-none-match") and not counter_buffer.has_pending(poll_id):
+            etag = poll_etag(await get_poll_version(db, poll_id))
+            if etag_matches(request, etag):
+                return not_modified(cache_headers(etag))
+        poll = await get_poll(db, poll_id)
+        if not poll:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        payload = poll_cache.put_poll(counter_buffer.overlay(poll))
+    
+    etag = poll_etag(payload.get("version"))
+    headers = cache_headers(etag)
+    if etag_matches(request, etag):
+        return not_modified(headers)
+    return JSONResponse(payload, headers=headers)
 
 @router.delete("/{poll_id}")
-def delete_poll_by_id(
+async def delete_poll_by_id(
     poll_id: UUID, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_auth)
 ):
     """Delete a poll (only creator can delete)"""
-    poll = get_poll(db, poll_id)
+    poll = await get_poll(db, poll_id)
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
     
     if poll.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this poll")
     
-    success = delete_poll(db, poll_id)
+    success = await delete_poll(db, poll_id)
+    poll_cache.invalidate_poll(poll_id)
+    trending.remove_poll(poll_id)
     if not success:
         raise HTTPException(status_code=404, detail="Poll not found")
     return {"message": "Poll deleted successfully"}
@@ -1,96 +1,136 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List
 from uuid import UUID
+import json
+import os
 from ..database import get_db
-from ..schemas import VoteCreate, VoteResponse
-from ..models import Vote, PollOption, Poll
-from ..services.realtime_service import broadcast_vote_update
+from ..schemas import VoteBatchResponse, VoteCreate, VoteResponse
+from ..models import Vote
+from ..services.realtime_service import broadcast_vote_counts
+from ..services.vote_service import cast_vote, cast_votes
+from ..profiler import query_budget
+from ..rate_limit import rate_limit
 
 router = APIRouter(prefix="/votes", tags=["votes"])
 
-@router.post("/", response_model=VoteResponse)
-async def create_vote(vote: VoteCreate, db: Session = Depends(get_db)):
+# Largest number of votes accepted by one POST /votes/batch
+VOTE_BATCH_MAX_ITEMS = int(os.getenv("VOTE_BATCH_MAX_ITEMS", "1000"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+@router.post("/", response_model=VoteResponse, dependencies=[Depends(rate_limit("votes"))])
+@query_budget(1)
+async def create_vote(vote: VoteCreate, db: AsyncSession = Depends(get_db)):
     """
     Create or update a vote (atomic operation)
     If user already voted, update their vote
     """
     try:
-        # Check if poll and option exist
-        poll = db.query(Poll).filter(Poll.id == vote.poll_id).first()
-        if not poll:
-            raise HTTPException(status_code=404, detail="Poll not found")
-        
-        option = db.query(PollOption).filter(
-            and_(PollOption.id == vote.option_id, PollOption.poll_id == vote.poll_id)
-        ).first()
-        if not option:
-            raise HTTPException(status_code=404, detail="Option not found")
+        result = await cast_vote(db, vote)
         
-        # Check if user already voted
-        existing_vote = db.query(Vote).filter(
-            and_(Vote.poll_id == vote.poll_id, Vote.user_id == vote.user_id)
-        ).first()
-        
-        if existing_vote:
-            # User is changing their vote
-            if existing_vote.option_id == vote.option_id:
-                # Same option, no change needed
-                return existing_vote
-            
-            # Decrement old option count
-            old_option = db.query(PollOption).filter(PollOption.id == existing_vote.option_id).first()
-            if old_option:
-                old_option.vote_count = max(0, old_option.vote_count - 1)
-            
-            # Update vote
-            existing_vote.option_id = vote.option_id
-            
-            # Increment new option count
-            option.vote_count += 1
-            
-            db.commit()
-            db.refresh(existing_vote)
-            
-            # Broadcast updates for both options
-            if old_option:
-                await broadcast_vote_update(vote.poll_id, old_option.id, old_option.vote_count, poll.total_votes)
-            await broadcast_vote_update(vote.poll_id, option.id, option.vote_count, poll.total_votes)
-            
-            return existing_vote
-        else:
-            # New vote
-            new_vote = Vote(
-                poll_id=vote.poll_id,
-                option_id=vote.option_id,
-                user_id=vote.user_id
+        # Same option as before - nothing changed, nothing to broadcast
+        if result["changed"]:
+            await broadcast_vote_counts(
+                vote.poll_id, result["option_counts"], result["total_votes"], version=result["version"]
             )
-            db.add(new_vote)
-            
-            # Increment option count
-            option.vote_count += 1
-            
-            # Increment poll total votes
-            poll.total_votes += 1
-            
-            db.commit()
-            db.refresh(new_vote)
-            
-            # Broadcast update
-            await broadcast_vote_update(vote.poll_id, option.id, option.vote_count, poll.total_votes)
-            
-            return new_vote
+        
+        return result["vote"]
             
-    except HTTPException:
-        raise
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+def _check_batch_size(count: int):
+    if count > VOTE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {VOTE_BATCH_MAX_ITEMS} votes per batch")
+
+async def _read_batch(request: Request) -> List[Any]:
+    """
+    Read the raw items of a batch: a JSON array, or NDJSON (one vote per
+    line) which is parsed as it streams in. Lines that are not valid JSON
+    become ValueErrors so they are reported per item.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in NDJSON_TYPES:
+        items: List[Any] = []
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    items.append(_parse_line(line))
+            _check_batch_size(len(items))
+        if buffer.strip():
+            items.append(_parse_line(buffer))
+        _check_batch_size(len(items))
+        return items
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of votes or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of votes or NDJSON")
+    _check_batch_size(len(items))
+    return items
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+@router.post("/batch", response_model=VoteBatchResponse, dependencies=[Depends(rate_limit("votes_batch"))])
+@query_budget(3)
+async def create_votes(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Create or update many votes at once (JSON array or NDJSON body).
+    Votes are validated and applied with set-based statements in one
+    transaction, and each affected poll gets one broadcast. Every item gets
+    its own status; a bad item does not fail the batch.
+    """
+    items = await _read_batch(request)
+
+    results: List[dict] = [None] * len(items)
+    votes: List[VoteCreate] = []
+    positions: List[int] = []
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            results[index] = {"index": index, "status": "invalid", "detail": str(item)}
+            continue
+        try:
+            votes.append(VoteCreate.model_validate(item))
+            positions.append(index)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "invalid", "detail": str(e)}
+
+    try:
+        vote_results, counts = await cast_votes(db, votes)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for index, result in zip(positions, vote_results):
+        results[index] = {"index": index, **result}
+
+    for poll_id, entry in counts.items():
+        await broadcast_vote_counts(
+            UUID(poll_id), entry["option_counts"], entry["total_votes"], entry["votes"], version=entry["version"]
+        )
+
+    return {"results": results}
+
 @router.get("/poll/{poll_id}/user/{user_id}", response_model=VoteResponse | None)
-def get_user_vote(poll_id: UUID, user_id: UUID, db: Session = Depends(get_db)):
+@query_budget(1)
+async def get_user_vote(poll_id: UUID, user_id: UUID, db: AsyncSession = Depends(get_db)):
     """Get user's vote for a specific poll"""
-    vote = db.query(Vote).filter(
+    result = await db.execute(select(Vote).where(
         and_(Vote.poll_id == poll_id, Vote.user_id == user_id)
-    ).first()
-    return vote
+    ))
+    return result.scalar_one_or_none()
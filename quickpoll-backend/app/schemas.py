@@ -35,6 +35,8 @@ class PollResponse(BaseModel):
     total_comments: int
     options: List[PollOptionResponse]
     creator_id: UUID
+    # None while the counts include changes not yet written (write-behind mode)
+    version: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -54,6 +56,15 @@ class VoteResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class VoteBatchResult(BaseModel):
+    index: int
+    status: str  # created, updated, unchanged, not_found, conflict or invalid
+    vote: Optional[VoteResponse] = None
+    detail: Optional[str] = None
+
+class VoteBatchResponse(BaseModel):
+    results: List[VoteBatchResult]
+
 class LikeCreate(BaseModel):
     poll_id: UUID
     user_id: UUID
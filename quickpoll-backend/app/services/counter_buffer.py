@@ -0,0 +1,197 @@
+from sqlalchemy import Integer, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from typing import Dict, Optional
+from uuid import UUID
+import asyncio
+import os
+
+from ..database import AsyncSessionLocal
+from ..schemas import PollResponse
+
+# Opt-in write-behind mode for vote/like counters
+COUNTER_BUFFER_ENABLED = os.getenv("COUNTER_BUFFER_ENABLED", "false").lower() == "true"
+# Flush buffered deltas every N ms or once M events have accumulated
+COUNTER_FLUSH_MS = int(os.getenv("COUNTER_FLUSH_MS", "500"))
+COUNTER_FLUSH_EVENTS = int(os.getenv("COUNTER_FLUSH_EVENTS", "1000"))
+
+FLUSH_OPTIONS_SQL = text("""
+UPDATE poll_options AS o
+SET vote_count = GREATEST(o.vote_count + d.delta, 0)
+FROM unnest(:ids, :deltas) AS d(id, delta)
+WHERE o.id = d.id
+""").bindparams(
+    bindparam("ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+    bindparam("deltas", type_=ARRAY(Integer)),
+)
+
+FLUSH_POLLS_SQL = text("""
+UPDATE polls AS p
+SET total_votes = GREATEST(p.total_votes + d.votes, 0),
+    total_likes = GREATEST(p.total_likes + d.likes, 0),
+    version = p.version + 1
+FROM unnest(:ids, :votes, :likes) AS d(id, votes, likes)
+WHERE p.id = d.id
+""").bindparams(
+    bindparam("ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+    bindparam("votes", type_=ARRAY(Integer)),
+    bindparam("likes", type_=ARRAY(Integer)),
+)
+
+def _new_poll_entry() -> dict:
+    return {"total_votes": 0, "total_likes": 0, "options": {}}
+
+class CounterBuffer:
+    """
+    Accumulates vote and like counter deltas per poll in memory and writes them
+    to Postgres as batched UPDATEs, so a hot poll does not serialise every
+    vote on its counter rows. Vote and like rows themselves are still written
+    immediately; only the denormalised counters are deferred.
+    """
+
+    def __init__(self, enabled: bool, flush_ms: int, flush_events: int):
+        self.enabled = enabled
+        self.interval = flush_ms / 1000
+        self.flush_events = flush_events
+        # poll_id -> {"total_votes", "total_likes", "options": {option_id: delta}}
+        self.pending: Dict[str, dict] = {}
+        # Deltas taken by a flush that has not committed yet
+        self.in_flight: Dict[str, dict] = {}
+        self.events = 0
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+
+    def _entry(self, poll_id) -> dict:
+        key = str(poll_id)
+        if key not in self.pending:
+            self.pending[key] = _new_poll_entry()
+        return self.pending[key]
+
+    def _count_event(self):
+        self.events += 1
+        if self.events >= self.flush_events:
+            self.wakeup.set()
+
+    def add_vote(self, poll_id: UUID, option_id: UUID, previous_option_id: Optional[UUID] = None):
+        """Buffer a new vote, or a change from previous_option_id to option_id"""
+        entry = self._entry(poll_id)
+        options = entry["options"]
+        options[str(option_id)] = options.get(str(option_id), 0) + 1
+        if previous_option_id is None:
+            entry["total_votes"] += 1
+        else:
+            options[str(previous_option_id)] = options.get(str(previous_option_id), 0) - 1
+        self._count_event()
+
+    def add_like(self, poll_id: UUID, delta: int):
+        """Buffer a like (+1) or unlike (-1)"""
+        self._entry(poll_id)["total_likes"] += delta
+        self._count_event()
+
+    def delta(self, poll_id) -> dict:
+        """Deltas for a poll that are not yet in the database"""
+        key = str(poll_id)
+        result = _new_poll_entry()
+        for source in (self.in_flight.get(key), self.pending.get(key)):
+            if not source:
+                continue
+            result["total_votes"] += source["total_votes"]
+            result["total_likes"] += source["total_likes"]
+            for option_id, change in source["options"].items():
+                result["options"][option_id] = result["options"].get(option_id, 0) + change
+        return result
+
+    def has_pending(self, poll_id) -> bool:
+        key = str(poll_id)
+        return key in self.pending or key in self.in_flight
+
+    def overlay(self, poll):
+        """Return a poll (ORM object or PollResponse) with buffered deltas applied"""
+        if not self.has_pending(poll.id):
+            return poll
+        delta = self.delta(poll.id)
+        response = PollResponse.model_validate(poll).model_copy(deep=True)
+        # The stored version does not describe these counts
+        response.version = None
+        response.total_votes = max(0, response.total_votes + delta["total_votes"])
+        response.total_likes = max(0, response.total_likes + delta["total_likes"])
+        for option in response.options:
+            option.vote_count = max(0, option.vote_count + delta["options"].get(str(option.id), 0))
+        return response
+
+    async def _write(self, batch: Dict[str, dict]):
+        option_deltas: Dict[str, int] = {}
+        for entry in batch.values():
+            for option_id, change in entry["options"].items():
+                if change:
+                    option_deltas[option_id] = option_deltas.get(option_id, 0) + change
+        # Sorted ids keep row lock order stable across concurrent flushes
+        option_ids = sorted(option_deltas)
+        # Every poll whose counters change gets a new version
+        poll_ids = sorted(
+            poll_id for poll_id, entry in batch.items()
+            if entry["total_votes"] or entry["total_likes"] or any(entry["options"].values())
+        )
+
+        async with AsyncSessionLocal() as db:
+            if option_ids:
+                await db.execute(FLUSH_OPTIONS_SQL, {
+                    "ids": [UUID(i) for i in option_ids],
+                    "deltas": [option_deltas[i] for i in option_ids],
+                })
+            if poll_ids:
+                await db.execute(FLUSH_POLLS_SQL, {
+                    "ids": [UUID(i) for i in poll_ids],
+                    "votes": [batch[i]["total_votes"] for i in poll_ids],
+                    "likes": [batch[i]["total_likes"] for i in poll_ids],
+                })
+            await db.commit()
+
+    def _restore(self, batch: Dict[str, dict]):
+        """Put the deltas of a failed flush back in front of newer ones"""
+        for poll_id, entry in batch.items():
+            target = self._entry(poll_id)
+            target["total_votes"] += entry["total_votes"]
+            target["total_likes"] += entry["total_likes"]
+            for option_id, change in entry["options"].items():
+                target["options"][option_id] = target["options"].get(option_id, 0) + change
+
+    async def flush(self):
+        """Write all pending deltas to the database"""
+        if not self.pending or self.in_flight:
+            return
+        batch, self.pending = self.pending, {}
+        self.in_flight = batch
+        self.events = 0
+        try:
+            await self._write(batch)
+        except Exception as e:
+            print(f"Counter flush failed, will retry: {e}")
+            self._restore(batch)
+        finally:
+            # Either committed or restored to pending - no longer in flight
+            self.in_flight = {}
+
+    async def _run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self.enabled and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Let a running flush finish instead of cancelling it mid-write
+        if self.task:
+            self.stopping = True
+            self.wakeup.set()
+            await self.task
+            self.task = None
+        await self.flush()
+
+counter_buffer = CounterBuffer(COUNTER_BUFFER_ENABLED, COUNTER_FLUSH_MS, COUNTER_FLUSH_EVENTS)
@@ -0,0 +1,116 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Callable, Optional
+import asyncio
+import multiprocessing
+import os
+import time
+
+import bcrypt
+
+from ..metrics import PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS, Gauge
+
+# bcrypt runs in its own process pool so hashing neither holds the GIL nor
+# occupies the threadpool that serves regular requests
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Hash jobs waiting for a worker before new ones are turned away
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+def hash_password(password: str) -> str:
+    """Hash a password using bcrypt"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash"""
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full"""
+
+class PasswordHasher:
+    """
+    Bounded process pool for bcrypt. At most workers + queue_size jobs are
+    admitted at once; beyond that callers are rejected immediately instead of
+    piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        # Seconds per hash for the most recent jobs
+        self.latencies: deque = deque(maxlen=512)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # spawn: forking a process that already runs an event loop and
+            # database connections is unsafe
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    async def run(self, operation: str, fn: Callable, *args):
+        if self.admitted >= self.limit:
+            self.rejected += 1
+            PASSWORD_HASH_REJECTED.inc(operation=operation)
+            raise HashingOverloaded()
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.admitted -= 1
+            self.completed += 1
+            self.latencies.append(elapsed)
+            PASSWORD_HASH_SECONDS.observe(elapsed, operation=operation)
+
+    async def hash(self, password: str) -> str:
+        return await self.run("hash", hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run("verify", verify_password, plain_password, hashed_password)
+
+    def in_progress(self) -> int:
+        return min(self.admitted, self.workers)
+
+    def queue_depth(self) -> int:
+        return max(self.admitted - self.workers, 0)
+
+    def start(self):
+        # Spawn the workers now rather than on the first sign-in
+        pool = self._get_pool()
+        for _ in range(self.workers):
+            pool.submit(os.getpid)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "workers": self.workers,
+            "in_progress": self.in_progress(),
+            "queue_depth": self.queue_depth(),
+            "queue_limit": self.limit - self.workers,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p95": percentile(0.95),
+        }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
+
+Gauge("quickpoll_password_hash_in_progress", "bcrypt jobs running on a worker", password_hasher.in_progress)
+Gauge("quickpoll_password_hash_queue_depth", "bcrypt jobs waiting for a worker", password_hasher.queue_depth)
@@ -1,11 +1,23 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy import delete, false, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+import asyncio
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 from uuid import UUID
+from ..database import AsyncSessionLocal
 from ..models import Poll, PollOption, User
+from ..pagination import decode_cursor, encode_cursor
 from ..schemas import PollCreate, PollResponse
+from .counter_buffer import counter_buffer
+from .response_cache import poll_cache
 
-def create_poll(db: Session, poll_data: PollCreate) -> Poll:
+# Loader used by every poll read: one extra SELECT ... WHERE poll_id IN (...)
+# for all options of the result, ordered by position via the relationship
+WITH_OPTIONS = selectinload(Poll.options)
+
+async def create_poll(db: AsyncSession, poll_data: PollCreate) -> Poll:
     """Create a new poll with options"""
     # Create poll
     poll = Poll(
@@ -14,7 +26,7 @@ def create_poll(db: Session, poll_data: PollCreate) -> Poll:
         description=poll_data.description
     )
     db.add(poll)
-    db.flush()  # Get poll.id before adding options
+    await db.flush()  # Get poll.id before adding options
     
     # Create options
     for option_data in poll_data.options:
@@ -25,23 +37,224 @@ def create_poll(db: Session, poll_data: PollCreate) -> Poll:
         )
         db.add(option)
     
-    db.commit()
-    db.refresh(poll)
+    await db.commit()
+    await db.refresh(poll, attribute_names=["options"])
     return poll
 
-def get_poll(db: Session, poll_id: UUID) -> Optional[Poll]:
+async def get_poll(db: AsyncSession, poll_id: UUID) -> Optional[Poll]:
     """Get poll by ID with all options"""
-    return db.query(Poll).filter(Poll.id == poll_id).first()
+    result = await db.execute(
+        select(Poll).options(WITH_OPTIONS).where(Poll.id == poll_id)
+    )
+    return result.scalar_one_or_none()
+
+# Snapshot loads in progress per poll, so concurrent cache misses share one query
+_snapshot_loads: Dict[str, asyncio.Future] = {}
+_snapshot_tasks: Set[asyncio.Task] = set()
+
+async def get_poll_snapshot(poll_id: str) -> Optional[dict]:
+    """
+    Cached payload of a poll (None if it does not exist), for callers without
+    a request session such as WebSockets. A miss is loaded with a short-lived
+    session, and concurrent misses for one poll wait on the same load, so a
+    reconnect storm costs one query per poll. Raises ValueError for a bad id.
+    """
+    payload = poll_cache.get_poll(poll_id)
+    if payload is not None:
+        return payload
+    return (await get_poll_snapshots([poll_id]))[str(UUID(poll_id))]
+
+async def get_poll_snapshots(poll_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """
+    Like get_poll_snapshot for several polls, keyed by canonical id; all
+    misses not already being loaded are fetched together in one query
+    """
+    results: Dict[str, Optional[dict]] = {}
+    loads: Dict[str, asyncio.Future] = {}
+    missing = []
+    for poll_id in dict.fromkeys(str(UUID(poll_id)) for poll_id in poll_ids):
+        payload = poll_cache.get_poll(poll_id)
+        if payload is not None:
+            results[poll_id] = payload
+        elif poll_id in _snapshot_loads:
+            loads[poll_id] = _snapshot_loads[poll_id]
+        else:
+            missing.append(poll_id)
+    
+    if missing:
+        loop = asyncio.get_running_loop()
+        for poll_id in missing:
+            loads[poll_id] = _snapshot_loads[poll_id] = loop.create_future()
+        task = asyncio.create_task(_load_snapshots(missing))
+        _snapshot_tasks.add(task)
+        task.add_done_callback(_snapshot_tasks.discard)
+    
+    for poll_id, load in loads.items():
+        # Shielded so a viewer disconnecting mid-load does not cancel it for the rest
+        results[poll_id] = await asyncio.shield(load)
+    return results
+
+async def _load_snapshots(poll_ids: List[str]):
+    try:
+        async with AsyncSessionLocal() as db:
+            polls = await get_polls_by_ids(db, [UUID(poll_id) for poll_id in poll_ids])
+        payloads = {str(poll.id): poll_cache.put_poll(counter_buffer.overlay(poll)) for poll in polls}
+        for poll_id in poll_ids:
+            _snapshot_loads.pop(poll_id).set_result(payloads.get(poll_id))
+    except Exception as e:
+        for poll_id in poll_ids:
+            load = _snapshot_loads.pop(poll_id, None)
+            if load is not None and not load.done():
+                load.set_exception(e)
+
+async def get_poll_version(db: AsyncSession, poll_id: UUID) -> Optional[int]:
+    """Stored version of a poll (None if it does not exist); a single primary key lookup"""
+    result = await db.execute(select(Poll.version).where(Poll.id == poll_id))
+    return result.scalar_one_or_none()
 
-def get_all_polls(db: Session, skip: int = 0, limit: int = 100) -> List[Poll]:
+async def get_polls_by_ids(db: AsyncSession, poll_ids: List[UUID]) -> List[Poll]:
+    """Get several polls by primary key, in the order given"""
+    if not poll_ids:
+        return []
+    result = await db.execute(select(Poll).options(WITH_OPTIONS).where(Poll.id.in_(poll_ids)))
+    polls = {poll.id: poll for poll in result.scalars().all()}
+    return [polls[poll_id] for poll_id in poll_ids if poll_id in polls]
+
+async def get_all_polls(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Poll]:
     """Get all active polls"""
-    return db.query(Poll).filter(Poll.is_active == True).order_by(Poll.created_at.desc()).offset(skip).limit(limit).all()
-
-def delete_poll(db: Session, poll_id: UUID) -> bool:
-    """Delete a poll"""
-    poll = db.query(Poll).filter(Poll.id == poll_id).first()
-    if poll:
-        db.delete(poll)
-        db.commit()
-        return True
-    return False
+    result = await db.execute(
+        select(Poll).options(WITH_OPTIONS).where(Poll.is_active == True)
+        .order_by(Poll.created_at.desc()).offset(skip).limit(limit)
+    )
+    return result.scalars().all()
+
+# Feed sort modes; ties on the sort key are broken by id so every row has a
+# unique position that a keyset cursor can point at
+# "relevance" ranks search results and falls back to created_at without a search
+FEED_SORT_COLUMNS = {
+    "created_at": Poll.created_at,
+    "votes": Poll.total_votes,
+    "likes": Poll.total_likes,
+    "comments": Poll.total_comments,
+}
+
+# Text search configuration; must match polls_search_vector_update()
+SEARCH_CONFIG = "english"
+
+def search_tsquery(search: str, include_description: bool = False):
+    """
+    Prefix-match every word of the search text against the search_vector
+    column. Titles carry weight A and descriptions weight B, so title-only
+    search restricts the match to A. Returns None if the text has no words.
+    """
+    words = re.findall(r"[^\W_]+", search.lower())
+    if not words:
+        return None
+    suffix = ":*" if include_description else ":*A"
+    return func.to_tsquery(SEARCH_CONFIG, " & ".join(word + suffix for word in words))
+
+def _feed_query(
+    sort_by: str,
+    category: Optional[str],
+    search: Optional[str],
+    search_description: bool = False
+):
+    """Build the feed query and the expression it is ordered by"""
+    sort_key = FEED_SORT_COLUMNS.get(sort_by, Poll.created_at)
+    query = select(Poll).options(WITH_OPTIONS).where(Poll.is_active == True)
+    
+    # Filter by category
+    if category and category != "All":
+        query = query.where(Poll.category == category)
+    
+    # Full-text search (GIN index on search_vector)
+    if search:
+        tsquery = search_tsquery(search, search_description)
+        if tsquery is None:
+            query = query.where(false())
+        else:
+            # Materialised so the matches always come from the GIN index; the
+            # planner cannot estimate prefix queries and would otherwise walk a
+            # sort index filtering every row when the term is rare
+            matches = (
+                select(Poll.id).where(Poll.search_vector.op("@@")(tsquery))
+                .cte("matches").prefix_with("MATERIALIZED")
+            )
+            query = query.join(matches, matches.c.id == Poll.id)
+            if sort_by == "relevance":
+                sort_key = func.ts_rank(Poll.search_vector, tsquery)
+    
+    return query.order_by(sort_key.desc(), Poll.id.desc()), sort_key
+
+async def get_polls(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    sort_by: str = "created_at",
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    search_description: bool = False
+) -> List[Poll]:
+    """Get active polls with sorting, filtering and search, options included"""
+    query, _ = _feed_query(sort_by, category, search, search_description)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.scalars().all()
+
+def _poll_cursor(sort_by: str, key: Any, poll_id: UUID) -> str:
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    return encode_cursor(sort_by, key, poll_id)
+
+def _parse_poll_cursor(cursor: str, sort_by: str) -> Tuple[Any, UUID]:
+    values = decode_cursor(cursor)
+    if len(values) != 3 or values[0] != sort_by:
+        raise ValueError("Cursor does not match this sort order")
+    _, key, poll_id = values
+    try:
+        if sort_by == "relevance":
+            key = float(key)
+        elif FEED_SORT_COLUMNS.get(sort_by, Poll.created_at) is Poll.created_at:
+            key = datetime.fromisoformat(key)
+        else:
+            key = int(key)
+        return key, UUID(poll_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+async def get_polls_page(
+    db: AsyncSession,
+    limit: int = 100,
+    sort_by: str = "created_at",
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    search_description: bool = False
+) -> Tuple[List[Poll], Optional[str]]:
+    """
+    Keyset-paginated feed: returns one page of polls after the cursor and the
+    cursor of the next page (None on the last page). Each page is an index
+    range scan starting at the cursor, so deep pages cost the same as the first.
+    Raises ValueError for a malformed cursor.
+    """
+    # Without a search relevance is the created_at order, and so are its cursors
+    if sort_by == "relevance" and not search:
+        sort_by = "created_at"
+    query, sort_key = _feed_query(sort_by, category, search, search_description)
+    if cursor:
+        key, poll_id = _parse_poll_cursor(cursor, sort_by)
+        query = query.where(tuple_(sort_key, Poll.id) < tuple_(key, poll_id))
+    
+    # Select the sort key alongside each poll so the cursor can be built from it
+    result = await db.execute(query.add_columns(sort_key.label("sort_key")).limit(limit + 1))
+    rows = result.all()
+    polls = [row[0] for row in rows[:limit]]
+    if len(rows) <= limit:
+        return polls, None
+    last = rows[limit - 1]
+    return polls, _poll_cursor(sort_by, last.sort_key, last[0].id)
+
+async def delete_poll(db: AsyncSession, poll_id: UUID) -> bool:
+    """Delete a poll (options, votes, likes and comments cascade in the database)"""
+    result = await db.execute(delete(Poll).where(Poll.id == poll_id))
+    await db.commit()
+    return result.rowcount > 0
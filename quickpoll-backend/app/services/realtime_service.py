@@ -1,23 +1,165 @@
+from ..metrics import COMMENTS, LIKES, REALTIME_FLUSH_SECONDS, REALTIME_FRAMES, VOTES
+from ..pubsub import PayloadTooLarge
 from ..websocket_manager import manager
+from ..ws_protocol import DELTA_TOTALS
+from .response_cache import poll_cache
+from .trending_service import trending
+from typing import Dict, List, Optional, Tuple
 from uuid import UUID
+import asyncio
+import os
+import time
+
+# Interval between coalesced poll_delta frames; 0 sends every change immediately
+REALTIME_TICK_MS = int(os.getenv("REALTIME_TICK_MS", "100"))
+
+# A counter of a pending delta: an option id or a total such as "total_votes"
+Field = str
+# Latest value of a field and the poll version the write produced (None if unknown)
+FieldValue = Tuple[int, Optional[int]]
+
+def _put(entry: Dict[Field, FieldValue], field: Field, value: int, version: Optional[int]):
+    """Keep the later of two values of a field, unless the stored one has a newer version"""
+    current = entry.get(field)
+    if current is not None and current[1] is not None and version is not None and current[1] > version:
+        return
+    entry[field] = (value, version)
+
+class UpdateAggregator:
+    """
+    Collects counter changes per poll and sends combined poll_delta frames
+    per poll every tick. Counts are absolute, so only the latest value of each
+    counter needs to be kept between ticks.
+
+    Frames carry the poll version their counts were written at, so viewers
+    can ignore counts older than ones they already have: writes on one or
+    several workers can finish, and their frames arrive, out of order.
+    Counters last written at different versions go out as one frame per
+    version, so a frame never claims a version newer than its counts.
+    """
+
+    def __init__(self, interval_ms: int):
+        self.interval = interval_ms / 1000
+        self.pending: Dict[str, Dict[Field, FieldValue]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    async def record(
+        self,
+        poll_id: UUID,
+        option_counts: Optional[Dict[str, int]] = None,
+        version: Optional[int] = None,
+        **totals
+    ):
+        """Record the latest option counts and/or poll totals for a poll, written at version"""
+        entry = self.pending.setdefault(str(poll_id), {})
+        for field, value in {**(option_counts or {}), **totals}.items():
+            _put(entry, field, value, version)
+        if self.interval <= 0:
+            await self.flush()
+
+    @staticmethod
+    def frames(poll_id: str, entry: Dict[Field, FieldValue]) -> List[dict]:
+        """poll_delta frames for a poll's pending counters, oldest version first"""
+        by_version: Dict[Optional[int], dict] = {}
+        for field, (value, version) in entry.items():
+            frame = by_version.setdefault(version, {"type": "poll_delta", "poll_id": poll_id})
+            if field in DELTA_TOTALS:
+                frame[field] = value
+            else:
+                frame.setdefault("options", {})[field] = value
+        frames = []
+        for version in sorted(by_version, key=lambda v: -1 if v is None else v):
+            frame = by_version[version]
+            if version is not None:
+                frame["version"] = version
+            frames.append(frame)
+        return frames
+
+    async def flush(self):
+        """
+        Send the delta frames of every poll with changes since the last tick.
+        A poll whose frames cannot be published is queued again for the next
+        tick (behind anything recorded since), without holding up the others.
+        """
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        started = time.perf_counter()
+        sent = 0
+        for poll_id, entry in pending.items():
+            try:
+                for frame in self.frames(poll_id, entry):
+                    await manager.broadcast_to_poll(poll_id, frame)
+                    sent += 1
+            except PayloadTooLarge as e:
+                # Would fail again on every tick; viewers catch up with the next change
+                print(f"Realtime publish error for poll {poll_id}: {e}")
+            except Exception as e:
+                print(f"Realtime publish error for poll {poll_id}: {e}")
+                self._requeue(poll_id, entry)
+        REALTIME_FRAMES.inc(sent)
+        REALTIME_FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def _requeue(self, poll_id: str, entry: Dict[Field, FieldValue]):
+        # Counters recorded after the failed flush are the later values
+        merged = dict(entry)
+        for field, (value, version) in self.pending.get(poll_id, {}).items():
+            _put(merged, field, value, version)
+        self.pending[poll_id] = merged
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Realtime flush error: {e}")
+
+    def start(self):
+        if self.interval > 0 and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+aggregator = UpdateAggregator(REALTIME_TICK_MS)
 
 async def broadcast_vote_update(poll_id: UUID, option_id: UUID, new_vote_count: int, total_votes: int):
-    """Broadcast vote update to all connected clients"""
-    await manager.broadcast_to_poll(str(poll_id), {
-        "type": "vote_update",
-        "poll_id": str(poll_id),
-        "option_id": str(option_id),
-        "vote_count": new_vote_count,
-        "total_votes": total_votes
-    })
+    """Queue a vote count change for the next delta frame"""
+    await broadcast_vote_counts(poll_id, {str(option_id): new_vote_count}, total_votes)
 
-async def broadcast_like_update(poll_id: UUID, total_likes: int):
-    """Broadcast like count update to all connected clients"""
-    await manager.broadcast_to_poll(str(poll_id), {
-        "type": "like_update",
-        "poll_id": str(poll_id),
-        "total_likes": total_likes
-    })
+async def broadcast_vote_counts(
+    poll_id: UUID,
+    option_counts: Dict[str, int],
+    total_votes: int,
+    votes: int = 1,
+    version: Optional[int] = None
+):
+    """
+    Queue new counts for several options of a poll (after `votes` vote changes)
+    for the next delta frame. version is the poll version the write produced.
+    """
+    VOTES.inc(votes)
+    option_counts = {str(k): v for k, v in option_counts.items()}
+    poll_cache.patch_poll(poll_id, option_counts, version, total_votes=total_votes)
+    trending.observe(poll_id, total_votes=total_votes)
+    await aggregator.record(poll_id, option_counts, version, total_votes=total_votes)
+
+async def broadcast_like_update(poll_id: UUID, total_likes: int, version: Optional[int] = None):
+    """Queue a like count change for the next delta frame"""
+    LIKES.inc()
+    poll_cache.patch_poll(poll_id, version=version, total_likes=total_likes)
+    trending.observe(poll_id, total_likes=total_likes)
+    await aggregator.record(poll_id, version=version, total_likes=total_likes)
+
+async def broadcast_comment_count_update(poll_id: UUID, total_comments: int, version: Optional[int] = None):
+    """Queue a comment count change for the next delta frame"""
+    poll_cache.patch_poll(poll_id, version=version, total_comments=total_comments)
+    trending.observe(poll_id, total_comments=total_comments)
+    await aggregator.record(poll_id, version=version, total_comments=total_comments)
 
 async def send_poll_data(poll_id: UUID, poll_data: dict):
     """Send complete poll data to all connected clients"""
@@ -26,10 +168,21 @@ async def send_poll_data(poll_id: UUID, poll_data: dict):
         "data": poll_data
     })
 
-async def broadcast_comment_update(poll_id: UUID, comment_data: dict):
-    """Broadcast new comment to all connected clients"""
+async def broadcast_comment_update(
+    poll_id: UUID,
+    comment_data: dict,
+    total_comments: Optional[int] = None,
+    version: Optional[int] = None
+):
+    """
+    Broadcast new comment to all connected clients.
+    Comment bodies are sent right away; only the count is coalesced.
+    """
+    COMMENTS.inc()
     await manager.broadcast_to_poll(str(poll_id), {
         "type": "comment_update",
         "poll_id": str(poll_id),
         "comment": comment_data
     })
+    if total_comments is not None:
+        await broadcast_comment_count_update(poll_id, total_comments, version)
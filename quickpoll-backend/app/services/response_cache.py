@@ -0,0 +1,169 @@
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+import json
+import os
+
+from ..cache import TTLCache
+from ..schemas import PollResponse
+
+# Bounded cache of serialized poll payloads and feed pages
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+# Poll payloads are patched by every counter event, so they can live longer
+# than feed pages, whose order goes stale as counts change
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_FEED_TTL = int(os.getenv("RESPONSE_CACHE_FEED_TTL", "5"))
+
+
+class CacheBackend:
+    """
+    Storage used by PollCache. Values are plain JSON-compatible data so a
+    shared backend (e.g. Redis) can be dropped in for multiple workers.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    def replace(self, key: str, value: Any):
+        """Update an existing entry, keeping its expiry"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process LRU + TTL backend"""
+
+    def __init__(self, maxsize: int):
+        self.entries = TTLCache(maxsize, RESPONSE_CACHE_TTL)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.entries.get(key)
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.entries.set(key, value, ttl)
+
+    def replace(self, key: str, value: Any):
+        self.entries.replace(key, value)
+
+    def delete(self, key: str):
+        self.entries.pop(key)
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "maxsize": self.entries.maxsize}
+
+
+def create_cache_backend() -> CacheBackend:
+    """Build the backend selected by RESPONSE_CACHE_BACKEND"""
+    if RESPONSE_CACHE_BACKEND != "memory":
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {RESPONSE_CACHE_BACKEND}")
+    return MemoryCacheBackend(RESPONSE_CACHE_SIZE)
+
+
+class PollCache:
+    """
+    Serialized poll payloads keyed by poll id, and feed pages stored as
+    lists of poll ids. A feed hit is assembled from the poll entries, so
+    counter patches show up in feeds immediately; only feed order can lag,
+    by at most RESPONSE_CACHE_FEED_TTL. Poll create/delete moves the feed to
+    a new generation, which orphans every cached page.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float, feed_ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.feed_ttl = feed_ttl
+        self.generation = 0
+        self.hits = {"poll": 0, "feed": 0}
+        self.misses = {"poll": 0, "feed": 0}
+
+    def _count(self, kind: str, hit: bool):
+        (self.hits if hit else self.misses)[kind] += 1
+
+    # Poll payloads
+
+    def get_poll(self, poll_id) -> Optional[dict]:
+        payload = self.backend.get(f"poll:{poll_id}")
+        self._count("poll", payload is not None)
+        return payload
+
+    def put_poll(self, poll) -> dict:
+        """Serialize a poll (ORM object or PollResponse), cache and return it"""
+        payload = PollResponse.model_validate(poll).model_dump(mode="json")
+        self.backend.set(f"poll:{payload['id']}", payload, self.ttl)
+        return payload
+
+    def patch_poll(
+        self,
+        poll_id: UUID,
+        option_counts: Optional[Dict[str, int]] = None,
+        version: Optional[int] = None,
+        **totals
+    ):
+        """
+        Apply new absolute counts to a cached poll, if it is cached. version is
+        the poll version the write produced; it is only taken over when the
+        cached payload was at the version just before it, since otherwise the
+        payload has missed a change (e.g. one made by another worker) and no
+        longer matches any stored version. An unknown version means no ETag
+        until the payload is reloaded.
+        """
+        key = f"poll:{poll_id}"
+        payload = self.backend.get(key)
+        if payload is None:
+            return
+        if option_counts:
+            for option in payload["options"]:
+                if option["id"] in option_counts:
+                    option["vote_count"] = option_counts[option["id"]]
+        payload.update(totals)
+        current = payload.get("version")
+        payload["version"] = version if version is not None and current == version - 1 else None
+        # Written back for backends that hand out copies; the expiry is kept so
+        # a hot poll is still reloaded from the database every ttl seconds
+        self.backend.replace(key, payload)
+
+    def invalidate_poll(self, poll_id: UUID):
+        self.backend.delete(f"poll:{poll_id}")
+        self.invalidate_feeds()
+
+    # Feed pages
+
+    def feed_key(self, *params: Any) -> str:
+        return f"feed:{self.generation}:" + json.dumps(params, default=str)
+
+    def get_feed(self, key: str) -> Optional[Tuple[List[dict], Optional[str]]]:
+        """Return (poll payloads, next cursor) for a cached page"""
+        page = self.backend.get(key)
+        polls = None
+        if page is not None:
+            polls = [self.backend.get(f"poll:{poll_id}") for poll_id in page["ids"]]
+            # A page whose polls were evicted is rebuilt from the database
+            if any(poll is None for poll in polls):
+                polls = None
+        self._count("feed", polls is not None)
+        return (polls, page["next_cursor"]) if polls is not None else None
+
+    def put_feed(self, key: str, polls: list, next_cursor: Optional[str] = None) -> List[dict]:
+        """Cache a page of polls and return their payloads"""
+        payloads = [self.put_poll(poll) for poll in polls]
+        self.backend.set(key, {"ids": [p["id"] for p in payloads], "next_cursor": next_cursor}, self.feed_ttl)
+        return payloads
+
+    def invalidate_feeds(self):
+        self.generation += 1
+
+    def stats(self) -> dict:
+        stats = {"hits": self.hits, "misses": self.misses}
+        stats.update(self.backend.stats())
+        return stats
+
+
+poll_cache = PollCache(create_cache_backend(), RESPONSE_CACHE_TTL, RESPONSE_CACHE_FEED_TTL)
@@ -0,0 +1,219 @@
+from bisect import insort
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+import asyncio
+import math
+import os
+
+from sqlalchemy import select
+
+from ..database import AsyncSessionLocal
+from ..models import Poll
+
+# Activity loses half its weight every TRENDING_HALF_LIFE_HOURS
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "6"))
+# Polls kept ranked per category, and polls tracked overall
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "200"))
+TRENDING_MAX_TRACKED = int(os.getenv("TRENDING_MAX_TRACKED", "100000"))
+# Recent polls loaded at startup to seed the ranking
+TRENDING_SEED_POLLS = int(os.getenv("TRENDING_SEED_POLLS", "10000"))
+
+# How much one event of each kind counts towards a poll's score
+EVENT_WEIGHTS = {"total_votes": 1.0, "total_likes": 2.0, "total_comments": 3.0}
+
+# Every ranked feed also has an all-categories list
+ALL = "All"
+
+
+class TrendingRanker:
+    """
+    Exponentially decayed activity score per poll, kept in log space:
+
+        score = ln(sum(weight * exp((t_event - epoch) / tau)))
+
+    Decay applies to every poll at the same rate, so comparing these scores
+    ranks polls by their decayed activity *now* without ever rescoring them;
+    an event only touches its own poll. Scores never decrease, so a poll can
+    only enter a category's top K when it receives an event, and each top K
+    list is maintained incrementally. Reads are O(K).
+
+    Counts arrive as the absolute totals broadcast by realtime_service; the
+    increase since the last seen total is the event weight.
+    """
+
+    def __init__(self, half_life_hours: float, top_k: int, max_tracked: int):
+        self.tau = half_life_hours * 3600 / math.log(2)
+        self.epoch = datetime.utcnow()
+        self.top_k = top_k
+        self.max_tracked = max_tracked
+        self.scores: Dict[str, float] = {}
+        self.categories: Dict[str, str] = {}
+        self.totals: Dict[str, Dict[str, int]] = {}
+        # category -> [(score, poll_id)] ascending, at most top_k long
+        self.top: Dict[str, List[Tuple[float, str]]] = {}
+        # Polls with events but unknown category, waiting for a lookup
+        self.resolving: Set[str] = set()
+
+    def _time(self, when: Optional[datetime] = None) -> float:
+        return ((when or datetime.utcnow()) - self.epoch).total_seconds() / self.tau
+
+    def _add_score(self, poll_id: str, weight: float, when: Optional[datetime] = None):
+        if weight <= 0:
+            return
+        event = math.log(weight) + self._time(when)
+        current = self.scores.get(poll_id)
+        if current is None:
+            score = event
+        else:
+            # log(exp(a) + exp(b)) without overflow
+            high, low = max(current, event), min(current, event)
+            score = high + math.log1p(math.exp(low - high))
+        self.scores[poll_id] = score
+
+        category = self.categories.get(poll_id)
+        if category is not None:
+            self._rank(ALL, poll_id, current, score)
+            self._rank(category, poll_id, current, score)
+
+    def _rank(self, category: str, poll_id: str, old_score: Optional[float], score: float):
+        ranked = self.top.setdefault(category, [])
+        if old_score is not None:
+            try:
+                ranked.remove((old_score, poll_id))
+            except ValueError:
+                pass
+        if len(ranked) < self.top_k or score > ranked[0][0]:
+            insort(ranked, (score, poll_id))
+            if len(ranked) > self.top_k:
+                ranked.pop(0)
+
+    def _unrank(self, poll_id: str):
+        score = self.scores.get(poll_id)
+        category = self.categories.get(poll_id)
+        for name in (ALL, category):
+            ranked = self.top.get(name)
+            if ranked and (score, poll_id) in ranked:
+                ranked.remove((score, poll_id))
+                self._refill(name)
+
+    def _refill(self, category: str):
+        """Top a list back up to K from all tracked scores (only after removals)"""
+        ranked = self.top[category]
+        ranked_ids = {poll_id for _, poll_id in ranked}
+        candidates = [
+            (score, poll_id) for poll_id, score in self.scores.items()
+            if poll_id not in ranked_ids and poll_id in self.categories
+            and (category == ALL or self.categories[poll_id] == category)
+        ]
+        candidates.sort(reverse=True)
+        for entry in candidates[:self.top_k - len(ranked)]:
+            insort(ranked, entry)
+
+    def _prune(self):
+        """Forget the lowest-scored polls that are in no top K list"""
+        if len(self.scores) <= self.max_tracked:
+            return
+        ranked = {poll_id for entries in self.top.values() for _, poll_id in entries}
+        unranked = sorted((score, poll_id) for poll_id, score in self.scores.items() if poll_id not in ranked)
+        for _, poll_id in unranked[:len(self.scores) - int(self.max_tracked * 0.9)]:
+            self.scores.pop(poll_id, None)
+            self.categories.pop(poll_id, None)
+            self.totals.pop(poll_id, None)
+
+    def add_poll(self, poll_id: UUID, category: Optional[str], created_at: Optional[datetime] = None, **totals):
+        """Track a poll; existing counts are scored as activity at creation time"""
+        key = str(poll_id)
+        self.categories[key] = category or "General"
+        self.totals[key] = {name: totals.get(name) or 0 for name in EVENT_WEIGHTS}
+        # Creation itself counts as one event so new polls can surface
+        weight = 1.0 + sum(EVENT_WEIGHTS[name] * count for name, count in self.totals[key].items())
+        self._add_score(key, weight, created_at)
+        self._prune()
+
+    def remove_poll(self, poll_id: UUID):
+        key = str(poll_id)
+        self._unrank(key)
+        self.scores.pop(key, None)
+        self.categories.pop(key, None)
+        self.totals.pop(key, None)
+
+    def observe(self, poll_id: UUID, **totals):
+        """Score the increase of any absolute totals (total_votes, ...) since the last event"""
+        key = str(poll_id)
+        seen = self.totals.setdefault(key, {name: 0 for name in EVENT_WEIGHTS})
+        weight = 0.0
+        for name, count in totals.items():
+            if name not in EVENT_WEIGHTS or count is None:
+                continue
+            if key in self.categories or seen[name]:
+                weight += EVENT_WEIGHTS[name] * max(0, count - seen[name])
+            else:
+                # First sight of an untracked poll: only this event is new
+                weight += EVENT_WEIGHTS[name]
+            # Keep the high-water mark so unlike/re-like cycles score nothing
+            seen[name] = max(seen[name], count)
+        self._add_score(key, weight)
+        if key not in self.categories:
+            self._resolve_later(key)
+
+    def _resolve_later(self, poll_id: str):
+        if poll_id in self.resolving:
+            return
+        self.resolving.add(poll_id)
+        try:
+            asyncio.get_running_loop().create_task(self._resolve(poll_id))
+        except RuntimeError:
+            self.resolving.discard(poll_id)
+
+    async def _resolve(self, poll_id: str):
+        """Look up the category of a poll that had activity before being tracked"""
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Poll.category, Poll.is_active).where(Poll.id == UUID(poll_id))
+                )
+                row = result.first()
+            if row is None or not row.is_active:
+                self.scores.pop(poll_id, None)
+                self.totals.pop(poll_id, None)
+                return
+            self.categories[poll_id] = row.category or "General"
+            score = self.scores.get(poll_id)
+            if score is not None:
+                self._rank(ALL, poll_id, None, score)
+                self._rank(self.categories[poll_id], poll_id, None, score)
+            self._prune()
+        except Exception as e:
+            print(f"Trending lookup failed: {e}")
+        finally:
+            self.resolving.discard(poll_id)
+
+    def page(self, category: Optional[str], offset: int, limit: int) -> Tuple[List[str], Optional[int]]:
+        """Poll ids of one trending page and the offset of the next (None at the end)"""
+        ranked = self.top.get(category if category and category != ALL else ALL, [])
+        # Stored ascending; read from the top without copying the whole list
+        end = len(ranked) - offset
+        ids = [ranked[i][1] for i in range(end - 1, max(end - limit, 0) - 1, -1)] if end > 0 else []
+        next_offset = offset + limit if offset + limit < len(ranked) else None
+        return ids, next_offset
+
+    async def seed(self):
+        """Load the most recent active polls with their current counts"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Poll.id, Poll.category, Poll.created_at, Poll.total_votes, Poll.total_likes, Poll.total_comments)
+                .where(Poll.is_active == True)
+                .order_by(Poll.created_at.desc(), Poll.id.desc())
+                .limit(TRENDING_SEED_POLLS)
+            )
+            rows = result.all()
+        for row in rows:
+            self.add_poll(
+                row.id, row.category, row.created_at,
+                total_votes=row.total_votes, total_likes=row.total_likes, total_comments=row.total_comments,
+            )
+        print(f"Trending ranking seeded with {len(rows)} polls")
+
+
+trending = TrendingRanker(TRENDING_HALF_LIFE_HOURS, TRENDING_TOP_K, TRENDING_MAX_TRACKED)
@@ -0,0 +1,399 @@
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Dict, List, Tuple
+import uuid
+from ..schemas import VoteCreate
+from .counter_buffer import counter_buffer
+
+# Shared head of both vote statements: take the per-user lock, lock the user's
+# previous vote, validate the option and upsert the vote.
+VOTE_UPSERT_CTES = """
+WITH guard AS (
+    -- Serialise concurrent votes by the same user on the same poll, so a vote
+    -- row being inserted by another transaction is never locked out of order
+    SELECT pg_advisory_xact_lock(hashtextextended(CAST(:poll_id AS text) || CAST(:user_id AS text), 0))
+),
+prev AS (
+    SELECT id, option_id, voted_at FROM votes, guard
+    WHERE poll_id = :poll_id AND user_id = :user_id
+    FOR UPDATE OF votes
+),
+{option_ctes},
+upsert AS (
+    INSERT INTO votes (id, poll_id, option_id, user_id, voted_at)
+    -- Joining prev reads (and locks) the old rows before the upsert touches them
+    SELECT :vote_id, :poll_id, opt.id, :user_id, :voted_at FROM opt LEFT JOIN prev ON TRUE
+    ON CONFLICT (poll_id, user_id) DO UPDATE
+        SET option_id = EXCLUDED.option_id, voted_at = EXCLUDED.voted_at
+        WHERE votes.option_id <> EXCLUDED.option_id
+    RETURNING id, option_id, voted_at, (xmax = 0) AS inserted
+)"""
+
+VOTE_RESULT_COLUMNS = """
+    EXISTS (SELECT 1 FROM polls WHERE id = :poll_id) AS poll_exists,
+    EXISTS (SELECT 1 FROM opt) AS option_exists,
+    (SELECT inserted FROM upsert) AS inserted,
+    COALESCE((SELECT id FROM upsert), (SELECT id FROM prev)) AS vote_id,
+    COALESCE((SELECT option_id FROM upsert), (SELECT option_id FROM prev)) AS option_id,
+    COALESCE((SELECT voted_at FROM upsert), (SELECT voted_at FROM prev)) AS voted_at,
+    (SELECT option_id FROM prev) AS previous_option_id"""
+
+def _vote_statement(sql: str):
+    return text(sql).bindparams(
+        bindparam("poll_id", type_=PG_UUID(as_uuid=True)),
+        bindparam("option_id", type_=PG_UUID(as_uuid=True)),
+        bindparam("user_id", type_=PG_UUID(as_uuid=True)),
+        bindparam("vote_id", type_=PG_UUID(as_uuid=True)),
+    )
+
+# One statement: upsert the vote and apply counter deltas with in-place
+# increments, returning the new counts.
+# Locks are taken in a fixed order: user, vote, options, poll.
+CAST_VOTE_SQL = _vote_statement(VOTE_UPSERT_CTES.format(option_ctes="""
+-- Lock the new and old option rows in id order so concurrent vote changes
+-- between the same two options cannot deadlock
+locked AS (
+    SELECT id, poll_id FROM poll_options, guard
+    WHERE id = :option_id OR id = (SELECT option_id FROM prev)
+    ORDER BY id
+    FOR UPDATE OF poll_options
+),
+opt AS (
+    SELECT id FROM locked
+    WHERE id = :option_id AND poll_id = :poll_id
+)""") + """,
+option_counts AS (
+    UPDATE poll_options
+    SET vote_count = CASE
+        WHEN poll_options.id = upsert.option_id THEN poll_options.vote_count + 1
+        ELSE GREATEST(poll_options.vote_count - 1, 0)
+    END
+    FROM upsert
+    WHERE poll_options.id = upsert.option_id
+       OR (NOT upsert.inserted AND poll_options.id = (SELECT option_id FROM prev))
+    RETURNING poll_options.id, poll_options.vote_count
+),
+poll_totals AS (
+    UPDATE polls
+    SET total_votes = polls.total_votes + CASE WHEN upsert.inserted THEN 1 ELSE 0 END,
+        version = polls.version + 1
+    FROM upsert
+    WHERE polls.id = :poll_id
+    RETURNING polls.total_votes, polls.version
+)
+SELECT""" + VOTE_RESULT_COLUMNS + """,
+    (SELECT json_object_agg(id, vote_count) FROM option_counts) AS option_counts,
+    COALESCE(
+        (SELECT total_votes FROM poll_totals),
+        (SELECT total_votes FROM polls WHERE id = :poll_id)
+    ) AS total_votes,
+    (SELECT version FROM poll_totals) AS version
+""")
+
+# Write-behind variant: only the vote row is written; counters are read as
+# stored and the deltas go to the counter buffer. No counter rows are locked.
+CAST_VOTE_BUFFERED_SQL = _vote_statement(VOTE_UPSERT_CTES.format(option_ctes="""
+opt AS (
+    SELECT id FROM poll_options, guard
+    WHERE id = :option_id AND poll_id = :poll_id
+)""") + """
+SELECT""" + VOTE_RESULT_COLUMNS + """,
+    (
+        SELECT json_object_agg(id, vote_count) FROM poll_options
+        WHERE id = :option_id OR id = (SELECT option_id FROM prev)
+    ) AS option_counts,
+    (SELECT total_votes FROM polls WHERE id = :poll_id) AS total_votes,
+    NULL::bigint AS version
+""")
+
+# A concurrent first vote by the same user that commits while we wait for the
+# user lock is not in our snapshot, so the upsert takes the update (or, for the
+# same option, no-op) path without knowing the previous vote; retrying sees it.
+MAX_ATTEMPTS = 3
+
+async def cast_vote(db: AsyncSession, vote: VoteCreate) -> dict:
+    """
+    Create or change a user's vote in a single statement and commit it.
+    In write-behind mode the counter changes are buffered instead of applied.
+    Returns the vote, whether it changed anything, and the updated counts.
+    Raises LookupError if the poll or option does not exist.
+    """
+    statement = CAST_VOTE_BUFFERED_SQL if counter_buffer.enabled else CAST_VOTE_SQL
+    for _ in range(MAX_ATTEMPTS):
+        result = await db.execute(statement, {
+            "poll_id": vote.poll_id,
+            "option_id": vote.option_id,
+            "user_id": vote.user_id,
+            "vote_id": uuid.uuid4(),
+            "voted_at": datetime.utcnow(),
+        })
+        row = result.mappings().one()
+
+        if not row["poll_exists"]:
+            await db.rollback()
+            raise LookupError("Poll not found")
+        if not row["option_exists"]:
+            await db.rollback()
+            raise LookupError("Option not found")
+        if not row["inserted"] and row["previous_option_id"] is None:
+            await db.rollback()
+            continue
+
+        await db.commit()
+        changed = row["inserted"] is not None
+        option_counts = row["option_counts"] or {}
+        total_votes = row["total_votes"]
+        # Unknown in write-behind mode: the counts include buffered changes
+        version = row["version"]
+
+        if counter_buffer.enabled and changed:
+            counter_buffer.add_vote(
+                vote.poll_id,
+                row["option_id"],
+                None if row["inserted"] else row["previous_option_id"],
+            )
+            # Report stored counts plus everything still buffered
+            delta = counter_buffer.delta(vote.poll_id)
+            option_counts = {
+                option_id: max(0, count + delta["options"].get(option_id, 0))
+                for option_id, count in option_counts.items()
+            }
+            total_votes += delta["total_votes"]
+
+        return {
+            "vote": {
+                "id": row["vote_id"],
+                "poll_id": vote.poll_id,
+                "option_id": row["option_id"],
+                "user_id": vote.user_id,
+                "voted_at": row["voted_at"],
+            },
+            # False means the user re-voted for the same option
+            "changed": changed,
+            "option_counts": option_counts,
+            "total_votes": total_votes,
+            "version": version,
+        }
+
+    raise RuntimeError("Vote could not be applied, please retry")
+
+
+# Batch ingestion: the same upsert applied to a whole set of votes at once.
+# The per-user locks are taken by a separate statement first, so the batch
+# statement's snapshot already includes every concurrent vote of those users.
+BATCH_LOCK_SQL = text("""
+SELECT count(*) FROM (
+    SELECT pg_advisory_xact_lock(key) FROM (
+        SELECT hashtextextended(CAST(poll_id AS text) || CAST(user_id AS text), 0) AS key
+        FROM unnest(:poll_ids, :user_ids) AS k(poll_id, user_id)
+        -- Sorted so two batches with overlapping users cannot deadlock
+        ORDER BY key
+    ) keys
+) locked
+""").bindparams(
+    bindparam("poll_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+    bindparam("user_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+)
+
+BATCH_UPSERT_CTES = """
+WITH items AS (
+    SELECT * FROM unnest(:poll_ids, :option_ids, :user_ids, :vote_ids)
+        WITH ORDINALITY AS i(poll_id, option_id, user_id, vote_id, ord)
+),
+prev AS (
+    SELECT votes.id, votes.poll_id, votes.user_id, votes.option_id, votes.voted_at
+    FROM votes JOIN items ON votes.poll_id = items.poll_id AND votes.user_id = items.user_id
+    FOR UPDATE OF votes
+),
+{option_ctes},
+valid AS (
+    SELECT items.* FROM items
+    JOIN opt ON opt.id = items.option_id AND opt.poll_id = items.poll_id
+),
+upsert AS (
+    INSERT INTO votes (id, poll_id, option_id, user_id, voted_at)
+    -- Joining prev reads (and locks) the old rows before the upsert touches them
+    SELECT valid.vote_id, valid.poll_id, valid.option_id, valid.user_id, :voted_at
+    FROM valid LEFT JOIN prev ON prev.poll_id = valid.poll_id AND prev.user_id = valid.user_id
+    ON CONFLICT (poll_id, user_id) DO UPDATE
+        SET option_id = EXCLUDED.option_id, voted_at = EXCLUDED.voted_at
+        WHERE votes.option_id <> EXCLUDED.option_id
+    RETURNING id, poll_id, user_id, option_id, voted_at, (xmax = 0) AS inserted
+)"""
+
+BATCH_RESULT_SELECT = """
+SELECT
+    items.ord,
+    EXISTS (SELECT 1 FROM polls WHERE polls.id = items.poll_id) AS poll_exists,
+    EXISTS (SELECT 1 FROM valid WHERE valid.ord = items.ord) AS option_exists,
+    upsert.inserted,
+    COALESCE(upsert.id, prev.id) AS vote_id,
+    COALESCE(upsert.option_id, prev.option_id) AS option_id,
+    COALESCE(upsert.voted_at, prev.voted_at) AS voted_at,
+    prev.option_id AS previous_option_id
+FROM items
+LEFT JOIN upsert ON upsert.poll_id = items.poll_id AND upsert.user_id = items.user_id
+LEFT JOIN prev ON prev.poll_id = items.poll_id AND prev.user_id = items.user_id
+ORDER BY items.ord
+"""
+
+def _batch_statement(sql: str):
+    return text(sql).bindparams(
+        bindparam("poll_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+        bindparam("option_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+        bindparam("user_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+        bindparam("vote_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+    )
+
+# Counters are summed per option and per poll, so each affected counter row is
+# updated once. Locks are taken in the same order as a single vote:
+# user, votes, options (by id), polls (by id).
+CAST_VOTES_SQL = _batch_statement(BATCH_UPSERT_CTES.format(option_ctes="""
+opt AS (
+    SELECT id, poll_id FROM poll_options
+    WHERE id IN (SELECT option_id FROM items UNION SELECT option_id FROM prev)
+    ORDER BY id
+    FOR UPDATE
+)""") + """,
+option_deltas AS (
+    SELECT id, SUM(delta) AS delta FROM (
+        SELECT option_id AS id, 1 AS delta FROM upsert
+        UNION ALL
+        SELECT prev.option_id, -1 FROM upsert
+        JOIN prev ON prev.poll_id = upsert.poll_id AND prev.user_id = upsert.user_id
+        WHERE NOT upsert.inserted
+    ) changes
+    GROUP BY id
+),
+option_counts AS (
+    UPDATE poll_options
+    SET vote_count = GREATEST(poll_options.vote_count + option_deltas.delta, 0)
+    FROM option_deltas
+    WHERE poll_options.id = option_deltas.id AND option_deltas.delta <> 0
+),
+changed_polls AS (
+    SELECT poll_id, count(*) FILTER (WHERE inserted) AS votes FROM upsert GROUP BY poll_id
+),
+locked_polls AS (
+    SELECT id FROM polls WHERE id IN (SELECT poll_id FROM changed_polls)
+    ORDER BY id
+    FOR UPDATE
+),
+poll_totals AS (
+    UPDATE polls
+    SET total_votes = polls.total_votes + changed_polls.votes,
+        version = polls.version + 1
+    FROM changed_polls JOIN locked_polls ON locked_polls.id = changed_polls.poll_id
+    WHERE polls.id = changed_polls.poll_id
+)""" + BATCH_RESULT_SELECT)
+
+# Write-behind variant: only vote rows are written, deltas go to the buffer
+CAST_VOTES_BUFFERED_SQL = _batch_statement(BATCH_UPSERT_CTES.format(option_ctes="""
+opt AS (
+    SELECT id, poll_id FROM poll_options
+    WHERE id IN (SELECT option_id FROM items)
+)""") + BATCH_RESULT_SELECT)
+
+# Counts of every option of the affected polls, read inside the transaction
+BATCH_COUNTS_SQL = text("""
+SELECT polls.id AS poll_id, polls.total_votes, polls.version,
+       json_object_agg(poll_options.id, poll_options.vote_count) AS option_counts
+FROM polls JOIN poll_options ON poll_options.poll_id = polls.id
+WHERE polls.id = ANY(:poll_ids)
+GROUP BY polls.id
+""").bindparams(bindparam("poll_ids", type_=ARRAY(PG_UUID(as_uuid=True))))
+
+async def cast_votes(db: AsyncSession, votes: List[VoteCreate]) -> Tuple[List[dict], Dict[str, dict]]:
+    """
+    Create or change many votes with set-based statements and commit them.
+    Returns one result per input vote, in order, with a status of created,
+    updated, unchanged, not_found, or conflict (a later vote in the same batch
+    by the same user on the same poll replaces it), and the new counts of
+    every poll that changed: {poll_id: {"option_counts", "total_votes", "version", "votes"}}
+    where votes is the number of votes of the batch that changed it.
+    """
+    results: List[dict] = [None] * len(votes)
+    # Last vote per (poll, user) wins, as if the votes were sent one by one
+    latest: Dict[tuple, int] = {}
+    for index, vote in enumerate(votes):
+        key = (vote.poll_id, vote.user_id)
+        if key in latest:
+            results[latest[key]] = {"status": "conflict", "detail": "Replaced by a later vote in this batch"}
+        latest[key] = index
+    indexes = sorted(latest.values())
+    if not indexes:
+        return results, {}
+    batch = [votes[i] for i in indexes]
+
+    poll_ids = [vote.poll_id for vote in batch]
+    user_ids = [vote.user_id for vote in batch]
+    await db.execute(BATCH_LOCK_SQL, {"poll_ids": poll_ids, "user_ids": user_ids})
+    statement = CAST_VOTES_BUFFERED_SQL if counter_buffer.enabled else CAST_VOTES_SQL
+    result = await db.execute(statement, {
+        "poll_ids": poll_ids,
+        "option_ids": [vote.option_id for vote in batch],
+        "user_ids": user_ids,
+        "vote_ids": [uuid.uuid4() for _ in batch],
+        "voted_at": datetime.utcnow(),
+    })
+
+    changed = []
+    for index, vote, row in zip(indexes, batch, result.mappings().all()):
+        if not row["poll_exists"]:
+            results[index] = {"status": "not_found", "detail": "Poll not found"}
+            continue
+        if not row["option_exists"]:
+            results[index] = {"status": "not_found", "detail": "Option not found"}
+            continue
+        if row["inserted"] is None:
+            status = "unchanged"
+        else:
+            status = "created" if row["inserted"] else "updated"
+            changed.append((vote, row))
+        results[index] = {
+            "status": status,
+            "vote": {
+                "id": row["vote_id"],
+                "poll_id": vote.poll_id,
+                "option_id": row["option_id"],
+                "user_id": vote.user_id,
+                "voted_at": row["voted_at"],
+            },
+        }
+
+    counts: Dict[str, dict] = {}
+    if changed:
+        affected = sorted({vote.poll_id for vote, _ in changed})
+        rows = (await db.execute(BATCH_COUNTS_SQL, {"poll_ids": affected})).mappings().all()
+        counts = {
+            str(row["poll_id"]): {
+                "option_counts": row["option_counts"],
+                "total_votes": row["total_votes"],
+                "version": None if counter_buffer.enabled else row["version"],
+                "votes": 0,
+            }
+            for row in rows
+        }
+        for vote, _ in changed:
+            counts[str(vote.poll_id)]["votes"] += 1
+    await db.commit()
+
+    if counter_buffer.enabled and changed:
+        for vote, row in changed:
+            counter_buffer.add_vote(
+                vote.poll_id,
+                row["option_id"],
+                None if row["inserted"] else row["previous_option_id"],
+            )
+        # Report stored counts plus everything still buffered
+        for poll_id, entry in counts.items():
+            delta = counter_buffer.delta(poll_id)
+            entry["option_counts"] = {
+                option_id: max(0, count + delta["options"].get(option_id, 0))
+                for option_id, count in entry["option_counts"].items()
+            }
+            entry["total_votes"] += delta["total_votes"]
+
+    return results, counts
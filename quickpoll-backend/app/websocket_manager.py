@@ -1,64 +1,464 @@
 from fastapi import WebSocket
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set
 import asyncio
 import json
+import os
+import time
+import uuid
+
+from .metrics import REALTIME_OVERSIZED, WS_DROPPED_SENDS, WS_FANOUT_RECIPIENTS, WS_FANOUT_SECONDS, WS_SEND_SECONDS, Gauge
+from .pubsub import Broker, create_broker
+from .ws_protocol import (
+    DELTA_TOTALS, FORMAT_JSON, FORMAT_MSGPACK, Frame, OptionIndex, encode, encode_compact, option_index
+)
+
+CHANNEL_PREFIX = "poll_"
+
+# Frames buffered per connection before it is considered too slow and dropped
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# Seconds a single frame may take to send before the connection is dropped
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+# "Try again later" close code used for slow consumers
+CLOSE_TOO_SLOW = 1013
+
+# Only the largest rooms are exported per room, to bound metric cardinality
+METRICS_MAX_ROOMS = 100
+
+# Viewer counts of changed rooms are shared and sent at most once per interval
+VIEWER_COUNT_INTERVAL_MS = int(os.getenv("VIEWER_COUNT_INTERVAL_MS", "1000"))
+# Every worker republishes all its room counts this often; a worker not
+# heard from for three heartbeats is considered gone and its viewers dropped
+VIEWER_HEARTBEAT_SECONDS = 15
+VIEWERS_CHANNEL = "viewer_counts"
+# Rooms per published message, keeping it well under Postgres' NOTIFY limit
+VIEWERS_PER_MESSAGE = 100
+
+class ClientConnection:
+    """A WebSocket with a bounded outbound queue drained by its own writer task"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        manager: "ConnectionManager",
+        format: str = FORMAT_JSON,
+        multiplexed: bool = False
+    ):
+        self.websocket = websocket
+        self.manager = manager
+        self.format = format
+        # Subscribed to any number of rooms (/ws), so frames must name their poll
+        self.multiplexed = multiplexed
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.closed = False
+        self.writer = asyncio.create_task(self._write())
+
+    def enqueue(self, payload: Frame) -> bool:
+        """Queue an encoded frame without waiting; False if the client has fallen behind"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((time.perf_counter(), payload))
+            return True
+        except asyncio.QueueFull:
+            WS_DROPPED_SENDS.inc(reason="queue_full")
+            return False
+
+    async def _write(self):
+        try:
+            while True:
+                queued_at, payload = await self.queue.get()
+                if isinstance(payload, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(payload), SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(payload), SEND_TIMEOUT)
+                WS_SEND_SECONDS.observe(time.perf_counter() - queued_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Stalled or broken socket - drop it so it stops holding frames
+            WS_DROPPED_SENDS.inc(reason="send_failed")
+            self.manager.evict(self)
+
+    def close(self):
+        """Stop the writer task and discard queued frames"""
+        self.closed = True
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
+class ViewerCounts:
+    """
+    Viewer counts per room summed over every worker. Each worker publishes the
+    local counts of rooms that changed once per interval (and all of them
+    every heartbeat); the sum of the other workers' counts is kept per room,
+    so reading a total is O(1).
+    """
 
-class ConnectionManager:
     def __init__(self):
-        # Map poll_id to set of WebSocket connections
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.worker_id = uuid.uuid4().hex
+        # worker -> poll_id -> viewers, and poll_id -> sum over those workers
+        self.remote: Dict[str, Dict[str, int]] = {}
+        self.remote_totals: Dict[str, int] = {}
+        self.last_seen: Dict[str, float] = {}
+
+    def apply(self, worker: str, rooms: Dict[str, int]) -> Set[str]:
+        """Take over another worker's absolute room counts; returns the rooms whose total changed"""
+        self.last_seen[worker] = time.monotonic()
+        counts = self.remote.setdefault(worker, {})
+        changed = set()
+        for poll_id, count in rooms.items():
+            change = count - counts.get(poll_id, 0)
+            if not change:
+                continue
+            changed.add(poll_id)
+            if count:
+                counts[poll_id] = count
+            else:
+                counts.pop(poll_id, None)
+            total = self.remote_totals.get(poll_id, 0) + change
+            if total > 0:
+                self.remote_totals[poll_id] = total
+            else:
+                self.remote_totals.pop(poll_id, None)
+        return changed
+
+    def drop_worker(self, worker: str) -> Set[str]:
+        """Forget a worker that has stopped; returns the rooms whose total changed"""
+        rooms = dict.fromkeys(self.remote.get(worker, {}), 0)
+        changed = self.apply(worker, rooms)
+        self.remote.pop(worker, None)
+        self.last_seen.pop(worker, None)
+        return changed
+
+    def expire(self) -> Set[str]:
+        """Drop workers that missed three heartbeats"""
+        cutoff = time.monotonic() - 3 * VIEWER_HEARTBEAT_SECONDS
+        changed = set()
+        for worker in [w for w, seen in self.last_seen.items() if seen < cutoff]:
+            changed |= self.drop_worker(worker)
+        return changed
+
+    def remote_count(self, poll_id: str) -> int:
+        return self.remote_totals.get(poll_id, 0)
+
+class ConnectionManager:
+    def __init__(self, broker: Optional[Broker] = None):
+        # Map poll_id to the connections local to this process
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # Rooms of each connection; one for /ws/poll/{id}, any number for /ws
+        self.rooms: Dict[ClientConnection, Set[str]] = {}
+        # Option id -> index of each room's poll, for compact frames
+        self.option_indices: Dict[str, OptionIndex] = {}
+        # Newest poll version delivered per option id / total of each room
+        self.delta_versions: Dict[str, Dict[str, int]] = {}
         self.event_queue: asyncio.Queue = asyncio.Queue()
-        
-    async def connect(self, websocket: WebSocket, poll_id: str):
-        """Accept WebSocket connection and add to poll room"""
-        await websocket.accept()
+        # Messages reach local rooms through the broker so every process sees them
+        self.broker = broker or create_broker()
+        self.broker.set_handler(self._on_message)
+        self.broker.add_channel_handler(VIEWERS_CHANNEL, self._on_viewer_counts)
+        self.viewers = ViewerCounts()
+        # Rooms whose local count must be published, and rooms whose viewers
+        # need a new viewer_count frame
+        self.dirty_rooms: Set[str] = set()
+        self.stale_rooms: Set[str] = set()
+        self.viewer_interval = VIEWER_COUNT_INTERVAL_MS / 1000
+        self.viewer_task: Optional[asyncio.Task] = None
+        self.last_heartbeat = 0.0
+
+    async def start(self):
+        """Start the pub/sub backend and the viewer count ticks"""
+        await self.broker.start()
+        await self.broker.subscribe(VIEWERS_CHANNEL)
+        if self.viewer_interval > 0 and self.viewer_task is None:
+            self.viewer_task = asyncio.create_task(self._run_viewer_counts())
+
+    async def stop(self):
+        """Stop the viewer count ticks and the pub/sub backend"""
+        if self.viewer_task:
+            self.viewer_task.cancel()
+            self.viewer_task = None
+        try:
+            # Other workers drop this worker's viewers right away
+            await self.broker.publish(VIEWERS_CHANNEL, json.dumps({"worker": self.viewers.worker_id, "gone": True}))
+        except Exception as e:
+            print(f"Viewer count publish error: {e}")
+        await self.broker.stop()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        poll_id: Optional[str] = None,
+        format: str = FORMAT_JSON,
+        subprotocol: Optional[str] = None,
+        multiplexed: bool = False
+    ):
+        """Accept WebSocket connection and add it to a poll room, if one is given"""
+        await websocket.accept(subprotocol=subprotocol)
+        client = ClientConnection(websocket, self, format, multiplexed)
+        self.clients[websocket] = client
+        self.rooms[client] = set()
+        if poll_id is not None:
+            await self.join(websocket, poll_id)
+
+    async def join(self, websocket: WebSocket, poll_id: str) -> bool:
+        """Add a connection to a poll room; False if it was already in it"""
+        client = self.clients.get(websocket)
+        if client is None or poll_id in self.rooms[client]:
+            return False
+        self.rooms[client].add(poll_id)
         if poll_id not in self.active_connections:
             self.active_connections[poll_id] = set()
-        self.active_connections[poll_id].add(websocket)
-        
-        # Broadcast viewer count update
-        await self.broadcast_viewer_count(poll_id)
-        
-    def disconnect(self, websocket: WebSocket, poll_id: str):
-        """Remove WebSocket connection from poll room"""
+            # First local viewer - start receiving this room's messages
+            await self.broker.subscribe(CHANNEL_PREFIX + poll_id)
+        self.active_connections[poll_id].add(client)
+        await self.viewers_changed(poll_id)
+        return True
+
+    async def leave(self, websocket: WebSocket, poll_id: str):
+        """Remove a connection from a poll room"""
+        client = self.clients.get(websocket)
+        if client is not None and poll_id in self.rooms[client]:
+            self.rooms[client].discard(poll_id)
+            await self._leave_room(client, poll_id)
+
+    async def _leave_room(self, client: ClientConnection, poll_id: str):
         if poll_id in self.active_connections:
-            self.active_connections[poll_id].discard(websocket)
+            self.active_connections[poll_id].discard(client)
             if not self.active_connections[poll_id]:
                 del self.active_connections[poll_id]
-    
+                self.option_indices.pop(poll_id, None)
+                self.delta_versions.pop(poll_id, None)
+                # Last local viewer left - stop receiving this room's messages
+                await self.broker.unsubscribe(CHANNEL_PREFIX + poll_id)
+            await self.viewers_changed(poll_id)
+
+    def subscriptions(self, websocket: WebSocket) -> Set[str]:
+        """Rooms a connection is in"""
+        client = self.clients.get(websocket)
+        return self.rooms.get(client, set()) if client is not None else set()
+
+    async def disconnect(self, websocket: WebSocket, poll_id: Optional[str] = None):
+        """Remove WebSocket connection from every room it is in"""
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        client.close()
+        for room in self.rooms.pop(client, set()):
+            await self._leave_room(client, room)
+
+    def evict(self, client: ClientConnection):
+        """Drop a connection that cannot keep up with its room"""
+        if client.closed:
+            return
+        client.close()
+        asyncio.create_task(self._close_evicted(client))
+
+    async def _close_evicted(self, client: ClientConnection):
+        await self.disconnect(client.websocket)
+        try:
+            await asyncio.wait_for(client.websocket.close(code=CLOSE_TOO_SLOW), SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def set_option_index(self, poll_id: str, options: list):
+        """Remember the option order of a room's poll (from its snapshot)"""
+        if poll_id in self.active_connections:
+            self.option_indices[poll_id] = option_index(options)
+
+    async def send_json(self, websocket: WebSocket, message: dict):
+        """Queue a message for a single connection, in the connection's frame format"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        options = self.option_indices.get(message.get("poll_id"))
+        await self.send_text(websocket, encode(message, client.format, options, client.multiplexed))
+
+    async def send_text(self, websocket: WebSocket, payload: Frame):
+        """Queue an encoded frame for a single connection, keeping it ordered with broadcasts"""
+        client = self.clients.get(websocket)
+        if client and not client.enqueue(payload):
+            self.evict(client)
+
     async def broadcast_to_poll(self, poll_id: str, message: dict):
-        """Send message to all connections in a poll room"""
+        """Publish message to every process with viewers in a poll room"""
+        for payload in self.room_payloads(message):
+            await self.broker.publish(CHANNEL_PREFIX + poll_id, payload)
+
+    def room_payloads(self, message: dict) -> List[str]:
+        """
+        Encode a room message within the broker's payload limit. A poll_delta
+        too large for it is split by options (every part keeps the version);
+        anything else is replaced by a refetch frame telling viewers to reload
+        the poll, since retrying it could never succeed.
+        """
+        # Unescaped UTF-8 is a third of the size of \ud83d\ude00 escapes
+        payload = json.dumps(message, ensure_ascii=False)
+        limit = self.broker.max_payload
+        if limit is None or len(payload.encode("utf-8")) <= limit:
+            return [payload]
+        options = list(message.get("options", {}).items())
+        if message.get("type") == "poll_delta" and len(options) > 1:
+            REALTIME_OVERSIZED.inc(outcome="split")
+            half = len(options) // 2
+            rest = {"type": "poll_delta", "poll_id": message["poll_id"], "options": dict(options[half:])}
+            if "version" in message:
+                rest["version"] = message["version"]
+            return self.room_payloads(dict(message, options=dict(options[:half]))) + self.room_payloads(rest)
+        REALTIME_OVERSIZED.inc(outcome="refetch")
+        return [json.dumps({"type": "refetch", "poll_id": message["poll_id"]})]
+
+    async def _on_message(self, channel: str, payload: str):
+        """Deliver a published message to the local connections of its room"""
+        poll_id = channel[len(CHANNEL_PREFIX):]
+        if poll_id not in self.active_connections:
+            return
+        message = json.loads(payload)
+        if message.get("type") == "poll_delta" and message.get("version") is not None:
+            delta = self.drop_stale_counts(poll_id, message)
+            if delta is None:
+                return
+            if delta is not message:
+                message, payload = delta, json.dumps(delta)
+        await self.send_to_local(poll_id, payload, message)
+
+    def drop_stale_counts(self, poll_id: str, message: dict) -> Optional[dict]:
+        """
+        A versioned poll_delta without the counts this room was already sent
+        at a newer version (frames from other workers can arrive out of
+        order); None if every count in it is stale
+        """
+        version = message["version"]
+        seen = self.delta_versions.setdefault(poll_id, {})
+        options = {
+            option_id: count for option_id, count in message.get("options", {}).items()
+            if seen.get(option_id, -1) < version
+        }
+        totals = {key: message[key] for key in DELTA_TOTALS if key in message and seen.get(key, -1) < version}
+        if not options and not totals:
+            return None
+        for field in (*options, *totals):
+            seen[field] = version
+        if len(options) == len(message.get("options", {})) and len(totals) == sum(key in message for key in DELTA_TOTALS):
+            return message
+        delta = {"type": "poll_delta", "poll_id": message["poll_id"], **totals, "version": version}
+        if options:
+            delta["options"] = options
+        return delta
+
+    async def send_to_local(self, poll_id: str, payload: str, message: Optional[dict] = None):
+        """
+        Queue an encoded message on this process' connections in a poll room.
+        The payload is encoded once by the caller (and at most once more, in the
+        compact format, if the room has compact viewers) and never awaited per
+        client, so a stalled viewer cannot delay the rest of the room.
+        """
         if poll_id not in self.active_connections:
             return
-            
-        # Create a copy of the set to avoid "set changed size during iteration" error
-        connections = list(self.active_connections[poll_id].copy())
-        disconnected = set()
-        
-        for connection in connections:
+
+        started = time.perf_counter()
+        clients = list(self.active_connections[poll_id])
+        # Compact frames for single-room and multiplexed connections
+        compact: Dict[bool, bytes] = {}
+        for client in clients:
+            frame = payload
+            if client.format == FORMAT_MSGPACK:
+                if client.multiplexed not in compact:
+                    if message is None:
+                        message = json.loads(payload)
+                    compact[client.multiplexed] = encode_compact(
+                        message, self.option_indices.get(poll_id), client.multiplexed
+                    )
+                frame = compact[client.multiplexed]
+            if not client.enqueue(frame):
+                self.evict(client)
+        WS_FANOUT_SECONDS.observe(time.perf_counter() - started)
+        WS_FANOUT_RECIPIENTS.observe(len(clients))
+
+    # Viewer counts
+
+    async def viewers_changed(self, poll_id: str):
+        """
+        Note a join or leave. Counts are published and sent with the next
+        tick, so a wave of N joins costs one frame per viewer rather than N.
+        """
+        self.dirty_rooms.add(poll_id)
+        if self.viewer_interval <= 0:
+            await self.flush_viewer_counts()
+
+    async def flush_viewer_counts(self):
+        """Publish this worker's changed room counts and send new totals to local viewers"""
+        dirty, self.dirty_rooms = self.dirty_rooms, set()
+        heartbeat = time.monotonic() - self.last_heartbeat >= VIEWER_HEARTBEAT_SECONDS
+        if heartbeat:
+            self.last_heartbeat = time.monotonic()
+            rooms = {poll_id: len(clients) for poll_id, clients in self.active_connections.items()}
+            rooms.update({poll_id: 0 for poll_id in dirty if poll_id not in rooms})
+        else:
+            rooms = {poll_id: self.get_local_viewer_count(poll_id) for poll_id in dirty}
+        await self._publish_viewer_counts(rooms)
+
+        stale = dirty | self.stale_rooms | self.viewers.expire()
+        self.stale_rooms = set()
+        for poll_id in stale:
+            await self.broadcast_viewer_count(poll_id)
+
+    async def _publish_viewer_counts(self, rooms: Dict[str, int]):
+        items = list(rooms.items())
+        for start in range(0, len(items), VIEWERS_PER_MESSAGE):
+            await self.broker.publish(VIEWERS_CHANNEL, json.dumps({
+                "worker": self.viewers.worker_id,
+                "rooms": dict(items[start:start + VIEWERS_PER_MESSAGE]),
+            }))
+
+    async def _on_viewer_counts(self, channel: str, payload: str):
+        """Room counts published by a worker; this worker's own are already applied"""
+        message = json.loads(payload)
+        if message["worker"] == self.viewers.worker_id:
+            return
+        if message.get("gone"):
+            changed = self.viewers.drop_worker(message["worker"])
+        else:
+            changed = self.viewers.apply(message["worker"], message["rooms"])
+        # Only rooms with local viewers need a frame, at the next tick
+        self.stale_rooms.update(poll_id for poll_id in changed if poll_id in self.active_connections)
+        if self.viewer_interval <= 0:
+            await self.flush_viewer_counts()
+
+    async def _run_viewer_counts(self):
+        while True:
+            await asyncio.sleep(self.viewer_interval)
             try:
-                await connection.send_json(message)
-            except Exception:
-                disconnected.add(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection, poll_id)
-    
+                await self.flush_viewer_counts()
+            except Exception as e:
+                print(f"Viewer count flush error: {e}")
+
     async def broadcast_viewer_count(self, poll_id: str):
-        """Broadcast current viewer count to all clients in poll"""
+        """Send the current viewer count to this worker's clients in a poll room"""
         if poll_id not in self.active_connections:
             return
-            
-        viewer_count = len(self.active_connections[poll_id])
-        await self.broadcast_to_poll(poll_id, {
-            "type": "viewer_count",
-            "count": viewer_count
-        })
-    
+        message = {"type": "viewer_count", "poll_id": poll_id, "count": self.get_viewer_count(poll_id)}
+        await self.send_to_local(poll_id, json.dumps(message), message)
+
+    def get_local_viewer_count(self, poll_id: str) -> int:
+        """Viewers of a poll connected to this worker"""
+        return len(self.active_connections.get(poll_id, ()))
+
     def get_viewer_count(self, poll_id: str) -> int:
-        """Get current number of viewers for a poll"""
-        return len(self.active_connections.get(poll_id, set()))
+        """Viewers of a poll across all workers"""
+        return self.get_local_viewer_count(poll_id) + self.viewers.remote_count(poll_id)
+
+    def room_sizes(self, limit: int) -> Dict[str, int]:
+        """Local viewer counts of the largest rooms"""
+        rooms = sorted(self.active_connections.items(), key=lambda room: len(room[1]), reverse=True)
+        return {poll_id: len(clients) for poll_id, clients in rooms[:limit]}
 
 # Global connection manager instance
 manager = ConnectionManager()
+
+Gauge("quickpoll_ws_connections", "Open WebSocket connections", lambda: len(manager.clients))
+Gauge("quickpoll_ws_rooms", "Poll rooms with at least one local viewer", lambda: len(manager.active_connections))
+Gauge(
+    "quickpoll_ws_room_connections", f"Open WebSocket connections of the {METRICS_MAX_ROOMS} largest rooms",
+    lambda: manager.room_sizes(METRICS_MAX_ROOMS), ("poll_id",),
+)
@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional, Tuple, Union
+from uuid import UUID
+import json
+
+import msgpack
+from fastapi import WebSocket
+
+# WebSocket frame formats. JSON is the default; the compact format is chosen
+# with the "quickpoll.msgpack.v1" subprotocol or ?format=msgpack.
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+MSGPACK_SUBPROTOCOL = "quickpoll.msgpack.v1"
+
+# Compact frames are MessagePack maps with one-letter keys. "t" is the frame
+# type; on /ws/poll/{id} the room's poll is implied by the connection, on the
+# multiplexed /ws it is "r", the poll id as 16 raw bytes. Options are referred
+# to by their index in the initial snapshot's options list (position order).
+#
+#   {"t": "i", "p": <poll payload>, "n": viewers}        initial_data
+#   {"t": "d", "o": {index: votes}, "v": total_votes,
+#    "l": total_likes, "c": total_comments, "s": version} poll_delta (changed keys only)
+#   {"t": "n", "n": viewers}                              viewer_count
+#   {"t": "m", "m": <comment>}                            comment_update
+#   {"t": "e", "m": message}                              error
+#   {"t": "f"}                                            refetch
+#
+# A poll_delta's version is the poll version its counts were written at
+# (absent when unknown); counts from a frame with a version no newer than the
+# one a viewer already has for that option or total are stale.
+#
+# refetch replaces a message too large for the pub/sub backend: the viewer
+# should reload the poll and its comments.
+#
+# Pings are still answered with a "pong" text frame.
+COMPACT_TYPES = {
+    "initial_data": "i",
+    "poll_delta": "d",
+    "viewer_count": "n",
+    "comment_update": "m",
+    "error": "e",
+    "refetch": "f",
+}
+COMPACT_FIELDS = {
+    "poll": "p",
+    "viewer_count": "n",
+    "count": "n",
+    "options": "o",
+    "total_votes": "v",
+    "total_likes": "l",
+    "total_comments": "c",
+    "version": "s",
+    "comment": "m",
+    "message": "m",
+}
+
+# Poll totals a poll_delta may carry besides option counts
+DELTA_TOTALS = ("total_votes", "total_likes", "total_comments")
+
+Frame = Union[str, bytes]
+OptionIndex = Dict[str, int]
+
+def negotiate_format(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """
+    The frame format a client asked for, and the subprotocol to accept the
+    connection with (None when no subprotocol was offered)
+    """
+    offered = [p.strip() for p in websocket.headers.get("sec-websocket-protocol", "").split(",") if p.strip()]
+    if MSGPACK_SUBPROTOCOL in offered:
+        return FORMAT_MSGPACK, MSGPACK_SUBPROTOCOL
+    if websocket.query_params.get("format") == FORMAT_MSGPACK:
+        return FORMAT_MSGPACK, None
+    return FORMAT_JSON, None
+
+def option_index(options: List[dict]) -> OptionIndex:
+    """Option id -> index in a poll payload's options list"""
+    return {option["id"]: index for index, option in enumerate(options)}
+
+def encode_compact(message: dict, options: Optional[OptionIndex] = None, with_room: bool = False) -> bytes:
+    """
+    MessagePack frame for a JSON message. Option ids missing from the index
+    (or with no index) are kept as string keys.
+    """
+    frame = {"t": COMPACT_TYPES.get(message["type"], message["type"])}
+    if with_room and message.get("poll_id"):
+        frame["r"] = UUID(message["poll_id"]).bytes
+    for key, value in message.items():
+        if key in ("type", "poll_id"):
+            continue
+        if key == "options" and isinstance(value, dict):
+            value = {options.get(k, k) if options else k: v for k, v in value.items()}
+        frame[COMPACT_FIELDS.get(key, key)] = value
+    return msgpack.packb(frame)
+
+def encode(message: dict, format: str, options: Optional[OptionIndex] = None, with_room: bool = False) -> Frame:
+    """Encode a message for a connection using the given format"""
+    if format == FORMAT_MSGPACK:
+        return encode_compact(message, options, with_room)
+    return json.dumps(message)
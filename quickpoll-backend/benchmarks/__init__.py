@@ -0,0 +1 @@
+# Benchmark scripts (run from quickpoll-backend with python -m benchmarks.<name>)
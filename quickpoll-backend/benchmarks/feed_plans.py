@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Show the query plan of every feed sort x filter combination.
+
+Seeds synthetic polls inside a transaction that is rolled back, then runs
+EXPLAIN ANALYZE on the exact statements poll_service builds for the first
+page and for a page deep into the feed. Every plan should be a top-N scan of
+one of the idx_polls_feed_* indexes with no Sort node.
+
+    python -m benchmarks.feed_plans --rows 200000
+"""
+
+import argparse
+import sys
+
+from sqlalchemy import text, tuple_
+
+from app.database import engine
+from app.models import Poll
+from app.services.poll_service import FEED_SORT_COLUMNS, _feed_query
+
+CATEGORIES = ["Technology", "Sports", "Entertainment", "Politics", "Business", "Science", "Lifestyle", "General"]
+
+SEED_SQL = text("""
+INSERT INTO polls (id, title, category, created_at, is_active, total_votes, total_likes, total_comments)
+SELECT gen_random_uuid(),
+       'Benchmark poll ' || g,
+       (:categories)[1 + g % cardinality(:categories)],
+       now() - g * interval '1 minute',
+       g % 20 <> 0,
+       (random() * 5000)::int,
+       (random() * 500)::int,
+       (random() * 200)::int
+FROM generate_series(1, :rows) AS g
+""")
+
+def _plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+def explain(conn, statement) -> dict:
+    compiled = statement.compile(dialect=engine.dialect)
+    result = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + str(compiled), compiled.params)
+    plan = result.scalar()[0]
+    nodes = list(_plan_nodes(plan["Plan"]))
+    return {
+        "index": next((n["Index Name"] for n in nodes if "Index Name" in n), "-"),
+        "sorted": any(n["Node Type"] in ("Sort", "Incremental Sort") for n in nodes),
+        "buffers": plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0),
+        "ms": plan["Execution Time"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="synthetic polls to seed")
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    args = parser.parse_args()
+
+    failures = 0
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            print(f"Seeding {args.rows} polls (rolled back afterwards)...")
+            conn.execute(SEED_SQL, {"rows": args.rows, "categories": CATEGORIES})
+            conn.execute(text("ANALYZE polls"))
+
+            print(f"{'sort_by':<12}{'category':<12}{'page':<7}{'index':<36}{'sort?':<7}{'buffers':>8}{'ms':>9}")
+            for sort_by in FEED_SORT_COLUMNS:
+                for category in (None, "Technology"):
+                    query, sort_key = _feed_query(sort_by, category, None)
+                    # A cursor a few thousand rows into the feed
+                    middle = conn.execute(
+                        query.with_only_columns(sort_key, Poll.id).offset(args.rows // 40).limit(1)
+                    ).first()
+                    pages = [("first", query)]
+                    if middle:
+                        pages.append(("deep", query.where(tuple_(sort_key, Poll.id) < tuple_(*middle))))
+
+                    for page, statement in pages:
+                        plan = explain(conn, statement.limit(args.limit + 1))
+                        failures += plan["sorted"]
+                        print(
+                            f"{sort_by:<12}{category or 'All':<12}{page:<7}{plan['index']:<36}"
+                            f"{'SORT' if plan['sorted'] else 'no':<7}{plan['buffers']:>8}{plan['ms']:>9.2f}"
+                        )
+        finally:
+            trans.rollback()
+
+    if failures:
+        print(f"❌ {failures} plan(s) sort the filtered set instead of reading an index in order")
+        sys.exit(1)
+    print("✅ Every feed combination is a top-N index scan")
+
+if __name__ == "__main__":
+    main()
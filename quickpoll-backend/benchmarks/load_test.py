@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+"""
+HTTP load test of the real FastAPI app.
+
+Seeds users, polls, votes and comments into the configured database (tagged,
+and removed again afterwards unless --keep), then drives the app with
+concurrent clients for each scenario and reports latency percentiles and
+throughput as JSON, so runs can be compared between commits.
+
+By default the app runs in-process behind httpx's ASGI transport (startup
+and shutdown hooks included); pass --base-url to load a running server that
+uses the same DATABASE_URL instead. All simulated users share one client
+address, so the in-process app runs without rate limits unless RATE_LIMITS
+is set; a server under --base-url needs RATE_LIMITS="" for the same.
+
+    python -m benchmarks.load_test --output before.json
+    python -m benchmarks.load_test --scenarios vote_storm,feed_votes --compare before.json
+
+Scenarios:
+    vote_storm      POST /votes/ on one hot poll by random users
+    feed_<sort_by>  GET /polls/ pages for every sort_by, following cursors
+    comments        GET /comments/poll/{id} of random polls
+    login_burst     POST /auth/login of random users (bcrypt bound)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.password_service import hash_password
+
+CATEGORIES = ["Technology", "Sports", "Entertainment", "Politics", "Business", "Science", "Lifestyle", "General"]
+FEED_SORTS = ["created_at", "votes", "likes", "comments", "trending"]
+SCENARIOS = ["vote_storm"] + [f"feed_{sort_by}" for sort_by in FEED_SORTS] + ["comments", "login_burst"]
+PASSWORD = "benchmark-password"
+OPTIONS_PER_POLL = 4
+
+SEED_STEPS = [
+    ("users", """
+INSERT INTO users (id, username, email, password_hash, created_at)
+SELECT gen_random_uuid(), :tag || '_' || g, :tag || '_' || g || '@example.com', :password_hash, now()
+FROM generate_series(1, :users) AS g
+"""),
+    ("polls", """
+INSERT INTO polls (id, creator_id, title, description, category, created_at, is_active,
+                   total_votes, total_likes, total_comments)
+SELECT gen_random_uuid(), u.id, 'Benchmark poll ' || g, 'Seeded by ' || :tag,
+       (:categories)[1 + g % cardinality(:categories)], now() - g * interval '1 minute', true, 0, 0, 0
+FROM generate_series(1, :polls) AS g
+JOIN LATERAL (
+    SELECT id FROM users WHERE username = :tag || '_' || (1 + g % :users)
+) u ON TRUE
+"""),
+    ("options", """
+INSERT INTO poll_options (id, poll_id, option_text, vote_count, position)
+SELECT gen_random_uuid(), p.id, 'Option ' || n, 0, n - 1
+FROM polls p CROSS JOIN generate_series(1, :options_per_poll) AS n
+WHERE p.description = 'Seeded by ' || :tag
+"""),
+    ("votes", """
+WITH seeded_users AS (
+    SELECT id, row_number() OVER (ORDER BY username) AS n FROM users WHERE username LIKE :tag || '\\_%'
+),
+seeded_options AS (
+    SELECT o.id, o.poll_id, row_number() OVER (ORDER BY o.id) AS n
+    FROM poll_options o JOIN polls p ON p.id = o.poll_id
+    WHERE p.description = 'Seeded by ' || :tag
+),
+picks AS MATERIALIZED (
+    SELECT 1 + floor(random() * :users)::int AS user_n,
+           1 + floor(random() * :polls * :options_per_poll)::int AS option_n
+    FROM generate_series(1, :votes)
+)
+INSERT INTO votes (id, poll_id, option_id, user_id, voted_at)
+SELECT gen_random_uuid(), o.poll_id, o.id, u.id, now()
+FROM picks
+JOIN seeded_users u ON u.n = picks.user_n
+JOIN seeded_options o ON o.n = picks.option_n
+ON CONFLICT (poll_id, user_id) DO NOTHING
+"""),
+    ("comments", """
+WITH seeded_users AS (
+    SELECT id, username, row_number() OVER (ORDER BY username) AS n FROM users WHERE username LIKE :tag || '\\_%'
+),
+seeded_polls AS (
+    SELECT id, row_number() OVER (ORDER BY id) AS n FROM polls WHERE description = 'Seeded by ' || :tag
+),
+picks AS MATERIALIZED (
+    SELECT g, 1 + floor(random() * :users)::int AS user_n, 1 + floor(random() * :polls)::int AS poll_n
+    FROM generate_series(1, :comments) AS g
+)
+INSERT INTO comments (id, poll_id, user_id, username, comment_text, created_at)
+SELECT gen_random_uuid(), p.id, u.id, u.username, 'Benchmark comment ' || picks.g, now() - picks.g * interval '1 second'
+FROM picks
+JOIN seeded_users u ON u.n = picks.user_n
+JOIN seeded_polls p ON p.n = picks.poll_n
+"""),
+    ("counters", """
+WITH option_votes AS (
+    SELECT o.id, count(v.id) AS votes
+    FROM poll_options o JOIN polls p ON p.id = o.poll_id
+    LEFT JOIN votes v ON v.option_id = o.id
+    WHERE p.description = 'Seeded by ' || :tag
+    GROUP BY o.id
+)
+UPDATE poll_options SET vote_count = option_votes.votes
+FROM option_votes WHERE poll_options.id = option_votes.id
+"""),
+    ("totals", """
+UPDATE polls SET
+    total_votes = (SELECT count(*) FROM votes WHERE votes.poll_id = polls.id),
+    total_likes = (random() * 100)::int,
+    total_comments = (SELECT count(*) FROM comments WHERE comments.poll_id = polls.id)
+WHERE description = 'Seeded by ' || :tag
+"""),
+]
+
+CLEANUP_SQL = [
+    "DELETE FROM polls WHERE description = 'Seeded by ' || :tag",
+    "DELETE FROM users WHERE username LIKE :tag || '\\_%'",
+]
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+def seed(args, tag: str) -> dict:
+    """Insert the synthetic data set and return the ids the scenarios need"""
+    params = {
+        "tag": tag,
+        "users": args.users,
+        "polls": args.polls,
+        "votes": args.votes,
+        "comments": args.comments,
+        "options_per_poll": OPTIONS_PER_POLL,
+        "categories": CATEGORIES,
+        # One hash shared by every user keeps seeding fast
+        "password_hash": hash_password(PASSWORD),
+    }
+    with engine.begin() as conn:
+        conn.execute(text("SELECT setseed(:seed)"), {"seed": (args.seed % 1000) / 1000})
+        for name, sql in SEED_STEPS:
+            started = time.perf_counter()
+            result = conn.execute(text(sql), params)
+            log(f"  {name:<10}{result.rowcount:>9} rows  {time.perf_counter() - started:6.2f}s")
+        conn.execute(text("ANALYZE users, polls, poll_options, votes, comments"))
+
+        users = conn.execute(
+            text("SELECT id, email FROM users WHERE username LIKE :tag || '\\_%' ORDER BY username"), params
+        ).all()
+        polls = conn.execute(
+            text("""
+            SELECT p.id, array_agg(o.id ORDER BY o.position) AS options, p.total_comments
+            FROM polls p JOIN poll_options o ON o.poll_id = p.id
+            WHERE p.description = 'Seeded by ' || :tag
+            GROUP BY p.id ORDER BY p.created_at DESC
+            """), params
+        ).all()
+
+    return {
+        "users": [(str(row.id), row.email) for row in users],
+        # The newest poll is the hot poll of the vote storm
+        "hot_poll": (str(polls[0].id), [str(o) for o in polls[0].options]),
+        "commented_polls": [str(row.id) for row in polls if row.total_comments] or [str(polls[0].id)],
+    }
+
+def cleanup(tag: str):
+    with engine.begin() as conn:
+        for sql in CLEANUP_SQL:
+            conn.execute(text(sql), {"tag": tag})
+
+def make_scenario(name: str, data: dict, args):
+    """Return an async function(client, rng, state) issuing one request"""
+    if name == "vote_storm":
+        poll_id, options = data["hot_poll"]
+
+        async def vote(client, rng, state):
+            user_id, _ = rng.choice(data["users"])
+            return await client.post("/votes/", json={
+                "poll_id": poll_id, "option_id": rng.choice(options), "user_id": user_id,
+            })
+        return vote
+
+    if name.startswith("feed_"):
+        sort_by = name[len("feed_"):]
+
+        async def browse(client, rng, state):
+            # Each client reads up to --feed-pages pages, then starts over
+            if state.get("pages", 0) >= args.feed_pages or "cursor" not in state:
+                state.update(pages=0, cursor=None, category=rng.choice([None] + CATEGORIES))
+            params = {"sort_by": sort_by, "limit": args.page_size}
+            if state["category"]:
+                params["category"] = state["category"]
+            if state["cursor"]:
+                params["cursor"] = state["cursor"]
+            response = await client.get("/polls/", params=params)
+            state["pages"] += 1
+            state["cursor"] = response.headers.get("x-next-cursor")
+            if not state["cursor"]:
+                del state["cursor"]
+            return response
+        return browse
+
+    if name == "comments":
+        async def read_comments(client, rng, state):
+            return await client.get(
+                f"/comments/poll/{rng.choice(data['commented_polls'])}", params={"limit": args.page_size}
+            )
+        return read_comments
+
+    if name == "login_burst":
+        async def login(client, rng, state):
+            _, email = rng.choice(data["users"])
+            return await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+        return login
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+def summarize(latencies: list, statuses: dict, elapsed: float) -> dict:
+    ms = sorted(latency * 1000 for latency in latencies)
+    if len(ms) >= 2:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0] if ms else 0.0
+    return {
+        "requests": len(ms),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "rps": round(len(ms) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(ms[-1], 2) if ms else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else 0.0,
+    }
+
+async def run_scenario(client: httpx.AsyncClient, name: str, data: dict, args) -> dict:
+    request = make_scenario(name, data, args)
+    latencies = []
+    statuses = {}
+
+    async def worker(number: int, deadline: float, record: bool):
+        rng = random.Random(f"{args.seed}:{name}:{number}")
+        state = {}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = str((await request(client, rng, state)).status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if record:
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    if args.warmup > 0:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(worker(i, deadline, False) for i in range(args.concurrency)))
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(worker(i, deadline, True) for i in range(args.concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+async def run(args, data: dict) -> dict:
+    results = {}
+    timeout = httpx.Timeout(30.0)
+    if args.base_url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+            for name in args.scenarios:
+                results[name] = await run_scenario(client, name, data, args)
+                report_line(name, results[name])
+        return results
+
+    # Every request comes from one address and would hit the per-client limits
+    os.environ.setdefault("RATE_LIMITS", "")
+    from app.main import app
+
+    # Run the app's startup/shutdown hooks around the in-process client
+    async with app.router.lifespan_context(app):
+        # Unhandled errors come back as 500 responses, as from a real server
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=timeout) as client:
+            for name in args.scenarios:
+                results[name] = await run_scenario(client, name, data, args)
+                report_line(name, results[name])
+    return results
+
+def report_line(name: str, result: dict):
+    log(
+        f"  {name:<20}{result['requests']:>8}{result['errors']:>8}{result['rps']:>10.1f}"
+        f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+    )
+
+def compare(baseline_path: str, results: dict):
+    """Print throughput and p95 change against an earlier report"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    log(f"\nCompared with {baseline_path}:")
+    log(f"  {'scenario':<20}{'rps':>12}{'p95':>12}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        rps = (result["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0.0
+        p95 = (result["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        log(f"  {name:<20}{rps:>+11.1f}%{p95:>+11.1f}%")
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users to seed")
+    parser.add_argument("--polls", type=int, default=2000, help="synthetic polls to seed")
+    parser.add_argument("--votes", type=int, default=50000, help="synthetic votes to seed (duplicates dropped)")
+    parser.add_argument("--comments", type=int, default=20000, help="synthetic comments to seed")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent clients per scenario")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each scenario")
+    parser.add_argument("--page-size", type=int, default=20, help="limit of feed and comment pages")
+    parser.add_argument("--feed-pages", type=int, default=5, help="cursor pages a feed client reads before starting over")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for data and request mix")
+    parser.add_argument("--base-url", help="load a running server instead of the in-process app")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded data")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    tag = f"bench{uuid.uuid4().hex[:8]}"
+    log(f"Seeding {args.users} users, {args.polls} polls, {args.votes} votes, {args.comments} comments ({tag})...")
+    data = seed(args, tag)
+    try:
+        log(f"  {'scenario':<20}{'requests':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        results = asyncio.run(run(args, data))
+    finally:
+        if args.keep:
+            log(f"Seeded data kept (tag {tag})")
+        else:
+            cleanup(tag)
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "target": args.base_url or "asgi",
+        "config": {
+            key: getattr(args, key)
+            for key in ("users", "polls", "votes", "comments", "concurrency", "duration",
+                        "warmup", "page_size", "feed_pages", "seed")
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        log(f"✅ Report written to {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
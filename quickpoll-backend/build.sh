@@ -8,3 +8,9 @@ pip install -r requirements.txt
 python create_tables.py
 python add_category_migration.py
 python add_comments_table.py
+python add_feed_indexes_migration.py
+python add_search_migration.py
+python add_comment_indexes_migration.py
+python add_category_feed_indexes_migration.py
+python add_poll_version_migration.py
+python add_revoked_tokens_migration.py
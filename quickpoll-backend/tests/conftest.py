@@ -0,0 +1,74 @@
+import os
+import uuid
+
+import pytest
+
+# Requests in these tests go well past the production per-route limits
+os.environ.setdefault("RATE_LIMITS", "")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import async_engine
+from app.main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    """App client against the DATABASE_URL database, with startup and shutdown run"""
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    suffix = uuid.uuid4().hex[:10]
+    response = client.post("/auth/register", json={
+        "username": f"test_{suffix}",
+        "email": f"test_{suffix}@example.com",
+        "password": "password123",
+    })
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def create_poll(client, auth_headers) -> dict:
+    response = client.post("/polls/", headers=auth_headers, json={
+        "title": f"Test poll {uuid.uuid4().hex[:8]}",
+        "category": "Technology",
+        "options": [
+            {"option_text": "Yes", "position": 0},
+            {"option_text": "No", "position": 1},
+        ],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def poll(client, auth_headers):
+    """A fresh poll with two options, deleted again afterwards"""
+    poll = create_poll(client, auth_headers)
+    yield poll
+    client.delete(f"/polls/{poll['id']}", headers=auth_headers)
+
+
+@pytest.fixture
+def other_poll(client, auth_headers):
+    """A second fresh poll, for requests that span polls"""
+    poll = create_poll(client, auth_headers)
+    yield poll
+    client.delete(f"/polls/{poll['id']}", headers=auth_headers)
+
+
+@pytest.fixture
+def queries():
+    """Statements sent to the database while the test runs"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "after_cursor_execute", record)
+    yield statements
+    event.remove(async_engine.sync_engine, "after_cursor_execute", record)
@@ -0,0 +1,36 @@
+"""Password hashing metrics on /metrics"""
+import re
+import uuid
+
+from app.services.password_service import password_hasher
+
+
+def metric(client, sample: str) -> float:
+    """A sample's value, 0 if nothing has been recorded for its labels yet"""
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", client.get("/metrics").text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def register(client):
+    suffix = uuid.uuid4().hex[:10]
+    return client.post("/auth/register", json={
+        "username": f"metrics_{suffix}",
+        "email": f"metrics_{suffix}@example.com",
+        "password": "password123",
+    })
+
+
+def test_hash_latency_and_queue_are_exported(client):
+    hashed = metric(client, 'quickpoll_password_hash_duration_seconds_count{operation="hash"}')
+    assert register(client).status_code == 200
+    assert metric(client, 'quickpoll_password_hash_duration_seconds_count{operation="hash"}') == hashed + 1
+    assert "quickpoll_password_hash_in_progress 0" in client.get("/metrics").text
+    assert "quickpoll_password_hash_queue_depth 0" in client.get("/metrics").text
+
+
+def test_rejections_are_counted(client, monkeypatch):
+    rejected = metric(client, 'quickpoll_password_hash_rejected_total{operation="hash"}')
+
+    monkeypatch.setattr(password_hasher, "limit", 0)
+    assert register(client).status_code == 503
+    assert metric(client, 'quickpoll_password_hash_rejected_total{operation="hash"}') == rejected + 1
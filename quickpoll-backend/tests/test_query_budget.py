@@ -0,0 +1,55 @@
+"""Decorated routes stay within their declared query_budget, without N+1 statements"""
+import uuid
+
+import pytest
+
+from app.profiler import QueryBudgetExceeded, assert_query_budget
+from app.routes.polls import get_poll_by_id
+from app.services.response_cache import poll_cache
+
+
+def test_reads_within_budget(client, poll):
+    poll_cache.invalidate_poll(poll["id"])
+    user_id = str(uuid.uuid4())
+    with assert_query_budget() as check:
+        client.get("/polls/", params={"limit": 20})
+        client.get(f"/polls/{poll['id']}")
+        client.get(f"/votes/poll/{poll['id']}/user/{user_id}")
+        client.get(f"/likes/poll/{poll['id']}/user/{user_id}")
+        client.get(f"/comments/poll/{poll['id']}")
+    # Every request was checked against the budget its route declares
+    assert [budget for _, _, budget in check.requests] == [2, 3, 1, 1, 1]
+
+
+def test_writes_within_budget(client, auth_headers, poll):
+    user_id = str(uuid.uuid4())
+    option_id = poll["options"][0]["id"]
+    with assert_query_budget() as check:
+        client.post("/votes/", json={"poll_id": poll["id"], "option_id": option_id, "user_id": user_id})
+        client.post("/votes/batch", json=[
+            {"poll_id": poll["id"], "option_id": option_id, "user_id": str(uuid.uuid4())} for _ in range(20)
+        ])
+        client.post("/likes/", json={"poll_id": poll["id"], "user_id": user_id})
+        client.post("/comments/", headers=auth_headers, json={"poll_id": poll["id"], "comment_text": "Within budget"})
+    assert [budget for _, _, budget in check.requests] == [1, 3, 4, 5]
+
+
+def test_cached_reads_need_no_queries(client, poll):
+    client.get(f"/polls/{poll['id']}")
+    with assert_query_budget(0):
+        client.get(f"/polls/{poll['id']}")
+
+
+def test_over_budget_fails(client, poll):
+    poll_cache.invalidate_poll(poll["id"])
+    with pytest.raises(QueryBudgetExceeded, match="queries ran, budget is 1"):
+        with assert_query_budget(1):
+            client.get(f"/polls/{poll['id']}")
+
+
+def test_route_over_declared_budget_fails(client, poll, monkeypatch):
+    monkeypatch.setattr(get_poll_by_id, "query_budget", 1)
+    poll_cache.invalidate_poll(poll["id"])
+    with pytest.raises(QueryBudgetExceeded, match=r"GET /polls/\{poll_id\} ran 2 queries, budget is 1"):
+        with assert_query_budget():
+            client.get(f"/polls/{poll['id']}")
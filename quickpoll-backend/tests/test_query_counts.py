@@ -0,0 +1,93 @@
+"""Statements each hot endpoint sends to the database per request"""
+import uuid
+
+from app.services.response_cache import poll_cache
+
+
+def test_list_polls(client, poll, queries):
+    response = client.get("/polls/", params={"limit": 5})
+    assert response.status_code == 200
+    # One page query plus one batched options load
+    assert len(queries) == 2
+
+    queries.clear()
+    client.get("/polls/", params={"limit": 5})
+    assert len(queries) == 0
+
+
+def test_get_poll(client, poll, queries):
+    poll_cache.invalidate_poll(poll["id"])
+    response = client.get(f"/polls/{poll['id']}")
+    assert response.status_code == 200
+    assert len(queries) == 2
+
+    queries.clear()
+    etag = client.get(f"/polls/{poll['id']}").headers["etag"]
+    assert len(queries) == 0
+
+    # Revalidating an evicted poll only reads its version
+    poll_cache.invalidate_poll(poll["id"])
+    queries.clear()
+    response = client.get(f"/polls/{poll['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+
+def test_vote(client, poll, queries):
+    user_id = str(uuid.uuid4())
+    response = client.post("/votes/", json={"poll_id": poll["id"], "option_id": poll["options"][0]["id"], "user_id": user_id})
+    assert response.status_code == 200
+    assert len(queries) == 1
+
+    # Changing the vote is the same single statement
+    queries.clear()
+    response = client.post("/votes/", json={"poll_id": poll["id"], "option_id": poll["options"][1]["id"], "user_id": user_id})
+    assert response.status_code == 200
+    assert len(queries) == 1
+
+    queries.clear()
+    response = client.get(f"/votes/poll/{poll['id']}/user/{user_id}")
+    assert response.json()["option_id"] == poll["options"][1]["id"]
+    assert len(queries) == 1
+
+
+def test_vote_batch(client, poll, queries):
+    votes = [
+        {"poll_id": poll["id"], "option_id": poll["options"][0]["id"], "user_id": str(uuid.uuid4())}
+        for _ in range(10)
+    ]
+    response = client.post("/votes/batch", json=votes)
+    assert response.status_code == 200
+    # Independent of the batch size
+    assert len(queries) == 3
+
+
+def test_like(client, poll, queries):
+    user_id = str(uuid.uuid4())
+    response = client.post("/likes/", json={"poll_id": poll["id"], "user_id": user_id})
+    assert response.json() == {"liked": True, "total_likes": 1}
+    assert len(queries) == 4
+
+    queries.clear()
+    response = client.post("/likes/", json={"poll_id": poll["id"], "user_id": user_id})
+    assert response.json() == {"liked": False, "total_likes": 0}
+    assert len(queries) == 4
+
+    queries.clear()
+    response = client.get(f"/likes/poll/{poll['id']}/user/{user_id}")
+    assert response.json()["liked"] is False
+    assert len(queries) == 1
+
+
+def test_comments(client, auth_headers, poll, queries):
+    for text in ("First", "Second", "Third"):
+        response = client.post("/comments/", headers=auth_headers, json={"poll_id": poll["id"], "comment_text": text})
+        assert response.status_code == 200
+    # The signed-in user is cached after the first request, so four each
+    assert len(queries) == 12
+
+    queries.clear()
+    response = client.get(f"/comments/poll/{poll['id']}")
+    assert [comment["comment_text"] for comment in response.json()] == ["Third", "Second", "First"]
+    # Comment authors come from the same query, however many there are
+    assert len(queries) == 1
@@ -0,0 +1,16 @@
+"""RATE_LIMITS parsing"""
+import pytest
+
+from app.rate_limit import parse_limits
+
+
+def test_parse_limits():
+    assert parse_limits("likes=10/10, comments=5/60,") == {"likes": (1.0, 10.0), "comments": (5 / 60, 5.0)}
+    assert parse_limits("votes=30") == {"votes": (30.0, 30.0)}
+    assert parse_limits("") == {}
+
+
+@pytest.mark.parametrize("entry", ["votes=10/0", "votes=abc", "votes=0/10", "votes=-5/10", "=10/10", "votes=nan/1", "votes=inf/1"])
+def test_parse_limits_names_the_bad_entry(entry):
+    with pytest.raises(ValueError, match=f"Invalid RATE_LIMITS entry '{entry}'"):
+        parse_limits(f"likes=10/10,{entry}")
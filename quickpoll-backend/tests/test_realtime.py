@@ -0,0 +1,142 @@
+"""Ordering and delivery of coalesced poll_delta frames"""
+import asyncio
+import json
+import uuid
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from app.database import DATABASE_URL
+from app.pubsub import InMemoryBroker, PayloadTooLarge, PostgresBroker
+from app.services.realtime_service import UpdateAggregator
+from app.websocket_manager import ConnectionManager, manager
+
+POLL_ID = "0b7f8f5e-2f4e-4a51-9d6b-1d0f1e2a3b4c"
+
+
+def run_flush(aggregator, broadcast, monkeypatch):
+    monkeypatch.setattr("app.services.realtime_service.manager.broadcast_to_poll", broadcast)
+    asyncio.run(aggregator.flush())
+
+
+def test_late_write_does_not_replace_newer_counts(monkeypatch):
+    sent = []
+
+    async def broadcast(poll_id, frame):
+        sent.append(frame)
+
+    aggregator = UpdateAggregator(100)
+    asyncio.run(aggregator.record(POLL_ID, {"a": 5}, 7, total_votes=9))
+    # Written at version 6 but recorded after version 7
+    asyncio.run(aggregator.record(POLL_ID, {"a": 4, "b": 3}, 6, total_votes=8))
+    asyncio.run(aggregator.record(POLL_ID, version=8, total_likes=2))
+    run_flush(aggregator, broadcast, monkeypatch)
+
+    # One frame per version, so none claims a version newer than its counts
+    assert sent == [
+        {"type": "poll_delta", "poll_id": POLL_ID, "options": {"b": 3}, "version": 6},
+        {"type": "poll_delta", "poll_id": POLL_ID, "options": {"a": 5}, "total_votes": 9, "version": 7},
+        {"type": "poll_delta", "poll_id": POLL_ID, "total_likes": 2, "version": 8},
+    ]
+
+
+def test_failed_publish_is_retried_without_losing_other_polls(monkeypatch):
+    sent = []
+    other_poll = "5c1d3e0a-7b8c-4d9e-8f0a-1b2c3d4e5f60"
+
+    async def failing(poll_id, frame):
+        if poll_id == POLL_ID:
+            raise ConnectionError("broker down")
+        sent.append(frame)
+
+    async def working(poll_id, frame):
+        sent.append(frame)
+
+    aggregator = UpdateAggregator(100)
+    asyncio.run(aggregator.record(POLL_ID, version=3, total_likes=1))
+    asyncio.run(aggregator.record(other_poll, version=5, total_likes=4))
+    run_flush(aggregator, failing, monkeypatch)
+    assert [frame["poll_id"] for frame in sent] == [other_poll]
+
+    # A newer count recorded before the retry wins over the unsent one
+    asyncio.run(aggregator.record(POLL_ID, version=4, total_likes=2))
+    sent.clear()
+    run_flush(aggregator, working, monkeypatch)
+    assert sent == [{"type": "poll_delta", "poll_id": POLL_ID, "total_likes": 2, "version": 4}]
+
+
+def test_manager_drops_stale_counts():
+    manager = ConnectionManager(InMemoryBroker())
+    newer = {"type": "poll_delta", "poll_id": POLL_ID, "options": {"a": 5}, "total_likes": 2, "version": 9}
+    assert manager.drop_stale_counts(POLL_ID, newer) is newer
+
+    # An older frame from another worker keeps only the counts not sent since
+    older = {"type": "poll_delta", "poll_id": POLL_ID, "options": {"a": 4, "b": 1}, "total_likes": 1, "version": 8}
+    assert manager.drop_stale_counts(POLL_ID, older) == {
+        "type": "poll_delta", "poll_id": POLL_ID, "options": {"b": 1}, "version": 8,
+    }
+    assert manager.drop_stale_counts(POLL_ID, older) is None
+
+
+def test_invalid_poll_id_is_rejected_before_joining(client):
+    with client.websocket_connect("/ws/poll/not-a-uuid") as websocket:
+        assert websocket.receive_json() == {"type": "error", "message": "Invalid poll id"}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+    assert closed.value.code == 1008
+    assert "not-a-uuid" not in manager.active_connections
+
+
+def test_missing_poll_leaves_the_room(client):
+    poll_id = str(uuid.uuid4())
+    with client.websocket_connect(f"/ws/poll/{poll_id}") as websocket:
+        message = websocket.receive_json()
+        while message["type"] == "viewer_count":
+            message = websocket.receive_json()
+        assert message == {"type": "error", "poll_id": poll_id, "message": "Poll not found"}
+        assert poll_id not in manager.active_connections
+
+
+def test_room_messages_fit_the_notify_limit():
+    manager = ConnectionManager(PostgresBroker(DATABASE_URL))
+    limit = manager.broker.max_payload
+
+    # Emoji are sent as UTF-8 rather than as 12-byte \u escape pairs
+    comment = {"type": "comment_update", "poll_id": POLL_ID, "comment": {"comment_text": "\U0001f600" * 1000}}
+    assert len(manager.room_payloads(comment)) == 1
+
+    options = {str(uuid.uuid4()): index for index in range(400)}
+    delta = {"type": "poll_delta", "poll_id": POLL_ID, "options": options, "total_votes": 400, "version": 12}
+    parts = [json.loads(payload) for payload in manager.room_payloads(delta)]
+    assert len(parts) > 1
+    assert all(len(json.dumps(part, ensure_ascii=False).encode("utf-8")) <= limit for part in parts)
+    assert all(part["version"] == 12 for part in parts)
+    assert {k: v for part in parts for k, v in part["options"].items()} == options
+    assert [part.get("total_votes") for part in parts].count(400) == 1
+
+    huge = {"type": "comment_update", "poll_id": POLL_ID, "comment": {"comment_text": "x" * 10000}}
+    assert manager.room_payloads(huge) == [json.dumps({"type": "refetch", "poll_id": POLL_ID})]
+
+
+def test_oversized_payload_is_rejected_and_not_requeued(monkeypatch):
+    with pytest.raises(PayloadTooLarge):
+        asyncio.run(PostgresBroker(DATABASE_URL).publish("poll_" + POLL_ID, "x" * 8000))
+
+    async def too_large(poll_id, frame):
+        raise PayloadTooLarge("too large")
+
+    aggregator = UpdateAggregator(100)
+    asyncio.run(aggregator.record(POLL_ID, version=3, total_likes=1))
+    run_flush(aggregator, too_large, monkeypatch)
+    assert aggregator.pending == {}
+
+
+def test_comment_is_saved_when_its_broadcast_fails(client, auth_headers, poll, monkeypatch):
+    async def failing(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr("app.routes.comments.broadcast_comment_update", failing)
+    response = client.post("/comments/", headers=auth_headers, json={"poll_id": poll["id"], "comment_text": "Saved"})
+    assert response.status_code == 200
+    comments = client.get(f"/comments/poll/{poll['id']}").json()
+    assert [comment["comment_text"] for comment in comments] == ["Saved"]
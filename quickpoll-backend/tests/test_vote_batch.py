@@ -0,0 +1,76 @@
+"""Per-item results of POST /votes/batch"""
+import json
+import uuid
+
+
+def vote(poll, option=0, user_id=None):
+    return {"poll_id": poll["id"], "option_id": poll["options"][option]["id"], "user_id": user_id or str(uuid.uuid4())}
+
+
+def statuses(response):
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == list(range(len(results)))
+    return [result["status"] for result in results]
+
+
+def test_created_updated_and_unchanged(client, poll):
+    user_id = str(uuid.uuid4())
+    response = client.post("/votes/batch", json=[vote(poll, 0, user_id), vote(poll, 1)])
+    assert statuses(response) == ["created", "created"]
+    assert response.json()["results"][0]["vote"]["option_id"] == poll["options"][0]["id"]
+
+    response = client.post("/votes/batch", json=[vote(poll, 0, user_id)])
+    assert statuses(response) == ["unchanged"]
+
+    response = client.post("/votes/batch", json=[vote(poll, 1, user_id)])
+    assert statuses(response) == ["updated"]
+    assert response.json()["results"][0]["vote"]["option_id"] == poll["options"][1]["id"]
+
+    counts = {option["id"]: option["vote_count"] for option in client.get(f"/polls/{poll['id']}").json()["options"]}
+    assert counts == {poll["options"][0]["id"]: 0, poll["options"][1]["id"]: 2}
+
+
+def test_later_vote_on_the_same_poll_wins(client, poll):
+    user_id = str(uuid.uuid4())
+    response = client.post("/votes/batch", json=[vote(poll, 0, user_id), vote(poll, 1, user_id)])
+    assert statuses(response) == ["conflict", "created"]
+    assert response.json()["results"][0]["detail"] == "Replaced by a later vote in this batch"
+    assert response.json()["results"][1]["vote"]["option_id"] == poll["options"][1]["id"]
+    assert client.get(f"/polls/{poll['id']}").json()["total_votes"] == 1
+
+
+def test_missing_poll_and_options(client, poll, other_poll):
+    response = client.post("/votes/batch", json=[
+        dict(vote(poll), option_id=str(uuid.uuid4())),
+        dict(vote(poll), option_id=other_poll["options"][0]["id"]),
+        dict(vote(poll), poll_id=str(uuid.uuid4())),
+        vote(other_poll),
+    ])
+    assert statuses(response) == ["not_found", "not_found", "not_found", "created"]
+    assert [result.get("detail") for result in response.json()["results"]] == [
+        "Option not found", "Option not found", "Poll not found", None,
+    ]
+    assert client.get(f"/polls/{poll['id']}").json()["total_votes"] == 0
+
+
+def test_invalid_items_do_not_fail_the_batch(client, poll):
+    response = client.post("/votes/batch", json=[{"poll_id": poll["id"]}, "not a vote", vote(poll)])
+    assert statuses(response) == ["invalid", "invalid", "created"]
+
+
+def test_ndjson(client, poll):
+    lines = [json.dumps(vote(poll)), "{not json", "", json.dumps(vote(poll, 1))]
+    response = client.post(
+        "/votes/batch",
+        content="\n".join(lines) + "\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert statuses(response) == ["created", "invalid", "created"]
+    assert response.json()["results"][1]["detail"].startswith("Invalid JSON")
+    assert client.get(f"/polls/{poll['id']}").json()["total_votes"] == 2
+
+
+def test_malformed_body(client):
+    response = client.post("/votes/batch", content="{}", headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
@@ -411,13 +411,19 @@ export default function PollPage() {
           {/* Right Sidebar - Comments (Tablet 768px+ and Desktop) */}
           <aside className="hidden md:block md:col-span-5 lg:col-span-4 xl:col-span-3">
             <div className="sticky top-6">
-              <CommentsSection pollId={pollId} />
+              <CommentsSection
+                pollId={pollId}
+                totalComments={wsPoll?.total_comments}
+              />
             </div>
           </aside>
 
           {/* Comments Section - Mobile Only (below 768px) */}
           <div className="md:hidden">
-            <CommentsSection pollId={pollId} />
+            <CommentsSection
+              pollId={pollId}
+              totalComments={wsPoll?.total_comments}
+            />
           </div>
 
           {/* Related Polls - Mobile only (below 768px, shown after comments) */}
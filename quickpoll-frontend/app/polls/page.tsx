@@ -120,6 +120,8 @@ export default function PollsPage() {
 
   const handleSearch = () => {
     setActiveSearch(searchQuery);
+    // "Best Match" only exists while searching
+    if (!searchQuery && sortBy === "relevance") setSortBy("created_at");
   };
 
   const handleKeyPress = (e: React.KeyboardEvent<HTMLInputElement>) => {
@@ -245,6 +247,12 @@ export default function PollsPage() {
                 >
                   Latest
                 </SelectItem>
+                <SelectItem
+                  value="trending"
+                  className="text-[#E6E6E6] focus:bg-[#323232] focus:text-[#E6E6E6]"
+                >
+                  Trending
+                </SelectItem>
                 <SelectItem
                   value="votes"
                   className="text-[#E6E6E6] focus:bg-[#323232] focus:text-[#E6E6E6]"
@@ -263,6 +271,14 @@ export default function PollsPage() {
                 >
                   Most Comments
                 </SelectItem>
+                {activeSearch && (
+                  <SelectItem
+                    value="relevance"
+                    className="text-[#E6E6E6] focus:bg-[#323232] focus:text-[#E6E6E6]"
+                  >
+                    Best Match
+                  </SelectItem>
+                )}
               </SelectContent>
             </Select>
           </div>
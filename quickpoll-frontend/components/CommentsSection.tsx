@@ -25,14 +25,18 @@ import { Comment } from "@/types/poll";
 
 interface CommentsSectionProps {
   pollId: string;
+  totalComments?: number;
   onNewComment?: (comment: Comment) => void;
 }
 
 export function CommentsSection({
   pollId,
+  totalComments,
   onNewComment,
 }: CommentsSectionProps) {
   const [comments, setComments] = useState<Comment[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [newComment, setNewComment] = useState("");
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [loading, setLoading] = useState(true);
@@ -48,8 +52,9 @@ export function CommentsSection({
 
   const fetchComments = async () => {
     try {
-      const data = await commentsApi.getByPoll(pollId);
-      setComments(data);
+      const page = await commentsApi.getByPoll(pollId);
+      setComments(page.comments);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error("Error fetching comments:", error);
     } finally {
@@ -57,6 +62,25 @@ export function CommentsSection({
     }
   };
 
+  const loadMoreComments = async () => {
+    if (!nextCursor) return;
+
+    try {
+      setLoadingMore(true);
+      const page = await commentsApi.getByPoll(pollId, nextCursor);
+      setComments((prev) => {
+        // Skip comments that arrived live while this page was loading
+        const seen = new Set(prev.map((c) => c.id));
+        return [...prev, ...page.comments.filter((c) => !seen.has(c.id))];
+      });
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Error fetching comments:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
 
@@ -119,6 +143,14 @@ export function CommentsSection({
     };
   }, [comments]);
 
+  // Expose a reload for comments too large to arrive live
+  useEffect(() => {
+    (window as any).refetchCommentsSection = fetchComments;
+    return () => {
+      delete (window as any).refetchCommentsSection;
+    };
+  }, [pollId]);
+
   const formatDate = (dateString: string) => {
     const date = new Date(dateString);
     const now = new Date();
@@ -144,7 +176,7 @@ export function CommentsSection({
             </div>
             <span className="text-[#E6E6E6]">Comments</span>
             <span className="text-sm font-normal text-[#A4A4A4]">
-              ({comments.length})
+              ({totalComments ?? comments.length})
             </span>
           </CardTitle>
         </CardHeader>
@@ -267,6 +299,17 @@ export function CommentsSection({
                     )}
                   </div>
                 ))}
+                {nextCursor && (
+                  <Button
+                    variant="ghost"
+                    size="sm"
+                    onClick={loadMoreComments}
+                    disabled={loadingMore}
+                    className="w-full text-xs text-[#A4A4A4] hover:text-[#E6E6E6] hover:bg-[#323232]"
+                  >
+                    {loadingMore ? "Loading..." : "Load more comments"}
+                  </Button>
+                )}
               </div>
             </ScrollArea>
           )}
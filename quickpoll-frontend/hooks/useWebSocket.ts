@@ -2,9 +2,52 @@
 
 import { useEffect, useState, useRef, useCallback } from 'react';
 import { Poll, WebSocketMessage } from '@/types/poll';
+import { pollsApi } from '@/lib/api';
 
 const WS_BASE_URL = process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8000';
 
+const DELTA_TOTALS = ['total_votes', 'total_likes', 'total_comments'] as const;
+
+// Poll version each option id / total was last updated at
+type DeltaVersions = Record<string, number>;
+
+// Every count in a snapshot is as of its version
+function snapshotVersions(snapshot: Poll): DeltaVersions {
+  const versions: DeltaVersions = {};
+  if (snapshot.version != null) {
+    for (const field of [...snapshot.options.map((opt) => opt.id), ...DELTA_TOTALS]) {
+      versions[field] = snapshot.version;
+    }
+  }
+  return versions;
+}
+
+/**
+ * The counts of a poll_delta that are newer than the ones already applied.
+ * Frames from different server workers can arrive out of order, so counts
+ * written at an older poll version than the one we have are dropped.
+ */
+function freshCounts(message: WebSocketMessage, versions: DeltaVersions) {
+  const version = message.version;
+  const options: Record<string, number> = {};
+  const totals: Partial<Record<(typeof DELTA_TOTALS)[number], number>> = {};
+  const isFresh = (field: string) => version == null || (versions[field] ?? -1) < version;
+
+  for (const [optionId, count] of Object.entries(message.options || {})) {
+    if (isFresh(optionId)) options[optionId] = count;
+  }
+  for (const key of DELTA_TOTALS) {
+    const value = message[key];
+    if (value != null && isFresh(key)) totals[key] = value;
+  }
+  if (version != null) {
+    for (const field of [...Object.keys(options), ...Object.keys(totals)]) {
+      versions[field] = version;
+    }
+  }
+  return { options, totals };
+}
+
 export function useWebSocket(pollId: string) {
   const [poll, setPoll] = useState<Poll | null>(null);
   const [isConnected, setIsConnected] = useState(false);
@@ -15,6 +58,7 @@ export function useWebSocket(pollId: string) {
   const isConnectingRef = useRef(false);
   const shouldReconnectRef = useRef(true);
   const pingIntervalRef = useRef<NodeJS.Timeout>();
+  const deltaVersionsRef = useRef<DeltaVersions>({});
 
   const connect = useCallback(() => {
     if (!pollId || isConnectingRef.current || !shouldReconnectRef.current) return;
@@ -61,35 +105,43 @@ export function useWebSocket(pollId: string) {
           switch (message.type) {
             case 'initial_data':
               if (message.poll) {
+                deltaVersionsRef.current = snapshotVersions(message.poll);
                 setPoll(message.poll);
                 setViewerCount(message.viewer_count || 0);
               }
               break;
 
-            case 'vote_update':
+            case 'refetch':
+              // An update too large to send live - reload the poll and its comments
+              pollsApi
+                .getById(pollId)
+                .then((snapshot) => {
+                  deltaVersionsRef.current = snapshotVersions(snapshot);
+                  setPoll(snapshot);
+                })
+                .catch((error) => console.error('Error reloading poll:', error));
+              if ((window as any).refetchCommentsSection) {
+                (window as any).refetchCommentsSection();
+              }
+              break;
+
+            case 'poll_delta': {
+              // Coalesced counter changes since the last server tick
+              const { options: optionCounts, totals } = freshCounts(message, deltaVersionsRef.current);
               setPoll((prev) => {
                 if (!prev) return prev;
                 return {
                   ...prev,
-                  total_votes: message.total_votes || prev.total_votes,
+                  ...totals,
                   options: prev.options.map((opt) =>
-                    opt.id === message.option_id
-                      ? { ...opt, vote_count: message.vote_count || opt.vote_count }
+                    opt.id in optionCounts
+                      ? { ...opt, vote_count: optionCounts[opt.id] }
                       : opt
                   ),
                 };
               });
               break;
-
-            case 'like_update':
-              setPoll((prev) => {
-                if (!prev) return prev;
-                return {
-                  ...prev,
-                  total_likes: message.total_likes || prev.total_likes,
-                };
-              });
-              break;
+            }
 
             case 'viewer_count':
               setViewerCount(message.count || 0);
@@ -120,8 +172,8 @@ export function useWebSocket(pollId: string) {
           clearInterval(pingIntervalRef.current);
         }
 
-        // Only reconnect if we should (not during cleanup)
-        if (shouldReconnectRef.current && reconnectAttemptsRef.current < 10) {
+        // Only reconnect if we should (not during cleanup, nor for an invalid poll id)
+        if (shouldReconnectRef.current && event.code !== 1008 && reconnectAttemptsRef.current < 10) {
           const delay = Math.min(1000 * Math.pow(2, reconnectAttemptsRef.current), 30000);
           reconnectAttemptsRef.current += 1;
 
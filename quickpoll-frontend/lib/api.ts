@@ -88,9 +88,17 @@ export const usersApi = {
 };
 
 export const commentsApi = {
-  getByPoll: async (pollId: string): Promise<any[]> => {
-    const response = await api.get(`/comments/poll/${pollId}`);
-    return response.data;
+  getByPoll: async (
+    pollId: string,
+    cursor?: string | null
+  ): Promise<{ comments: any[]; nextCursor: string | null }> => {
+    const response = await api.get(`/comments/poll/${pollId}`, {
+      params: cursor ? { cursor } : undefined,
+    });
+    return {
+      comments: response.data,
+      nextCursor: response.headers["x-next-cursor"] ?? null,
+    };
   },
 
   create: async (commentData: {
@@ -42,6 +42,17 @@ export const authApi = {
     });
     return response.data;
   },
+
+  logout: (token: string) => {
+    // keepalive lets the request finish while the page navigates away
+    return fetch(`${API_BASE_URL}/auth/logout`, {
+      method: 'POST',
+      headers: {
+        Authorization: `Bearer ${token}`,
+      },
+      keepalive: true,
+    });
+  },
 };
 
 export function saveAuth(authData: AuthResponse) {
@@ -61,6 +72,10 @@ export function getUser(): User | null {
 }
 
 export function logout() {
+  const token = getAuthToken();
+  if (token) {
+    authApi.logout(token).catch(() => {});
+  }
   localStorage.removeItem('auth_token');
   localStorage.removeItem('user');
   window.location.href = '/';
@@ -18,6 +18,7 @@ export interface Poll {
   total_comments: number;
   creator_id: string;
   options: PollOption[];
+  version?: number | null;
 }
 
 export interface Vote {
@@ -41,13 +42,14 @@ export interface Comment {
 }
 
 export interface WebSocketMessage {
-  type: 'initial_data' | 'vote_update' | 'like_update' | 'viewer_count' | 'comment_update' | 'error';
+  type: 'initial_data' | 'poll_delta' | 'viewer_count' | 'comment_update' | 'refetch' | 'error';
   poll?: Poll;
   poll_id?: string;
-  option_id?: string;
-  vote_count?: number;
+  options?: Record<string, number>;
   total_votes?: number;
   total_likes?: number;
+  total_comments?: number;
+  version?: number;
   count?: number;
   viewer_count?: number;
   comment?: Comment;